@@ -0,0 +1,229 @@
+import argparse
+import datetime as dt
+import hashlib
+import ipaddress
+import json
+import random
+import ssl
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+_S3_XMLNS: str = "http://s3.amazonaws.com/doc/2006-03-01/"
+_MOCK_PATH: str = "/_mock/"
+
+
+def create_certificate(cert_dir: Path) -> tuple[Path, Path]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = dt.datetime.now(tz=dt.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - dt.timedelta(minutes=5))
+        .not_valid_after(now + dt.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+
+    cert_path = cert_dir / "mock_s3.crt"
+    key_path = cert_dir / "mock_s3.key"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class MockS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address: tuple[str, int], latency: float, error_rate: float) -> None:
+        super().__init__(address, MockS3Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = random.Random(1)  # noqa: S311
+        self.buckets: dict[str, dict[str, tuple[bytes, str, str, str]]] = {}
+        self.versioning: set[str] = set()
+        self.requests: dict[str, int] = {}
+        self.bytes_written: int = 0
+        self.lock = threading.Lock()
+
+    def count(self, operation: str, written: int = 0) -> bool:
+        with self.lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+            self.bytes_written += written
+            return operation == "PutObject" and self.errors.random() < self.error_rate
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "bytes_written": self.bytes_written,
+                "objects": sum(len(objects) for objects in self.buckets.values()),
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.bytes_written = 0
+
+
+class MockS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockS3Server
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def parse(self) -> tuple[str, str, dict[str, str]]:
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        return bucket, unquote(key), query
+
+    def body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def reply(self, status: int, body: bytes = b"", headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_xml(self, body: str, status: int = 200) -> None:
+        self.reply(status, f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode(), {"Content-Type": "application/xml"})
+
+    def reply_error(self, status: int, code: str, key: str = "") -> None:
+        self.reply_xml(
+            f"<Error><Code>{code}</Code><Message>{code}</Message><Key>{escape(key)}</Key><BucketName></BucketName>"
+            f"<Resource>{escape(self.path)}</Resource><RequestId>mock</RequestId><HostId>mock</HostId></Error>",
+            status,
+        )
+
+    def do_GET(self) -> None:
+        if self.path.startswith(_MOCK_PATH):
+            self.reply(200, json.dumps(self.server.stats()).encode(), {"Content-Type": "application/json"})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        bucket, key, query = self.parse()
+        objects = self.server.buckets.setdefault(bucket, {})
+        if "location" in query:
+            self.server.count("GetBucketLocation")
+            self.reply_xml(f'<LocationConstraint xmlns="{_S3_XMLNS}"></LocationConstraint>')
+        elif "versioning" in query:
+            self.server.count("GetBucketVersioning")
+            status = "<Status>Enabled</Status>" if bucket in self.server.versioning else ""
+            self.reply_xml(f'<VersioningConfiguration xmlns="{_S3_XMLNS}">{status}</VersioningConfiguration>')
+        elif not key:
+            self.server.count("ListObjects")
+            self.list_objects(objects, query)
+        else:
+            self.server.count("GetObject")
+            if key not in objects:
+                self.reply_error(404, "NoSuchKey", key)
+                return
+            data, etag, version_id, _ = objects[key]
+            self.reply(200, data, {"ETag": f'"{etag}"', "x-amz-version-id": version_id, "Content-Type": "application/octet-stream"})
+
+    def list_objects(self, objects: dict[str, tuple[bytes, str, str, str]], query: dict[str, str]) -> None:
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        contents: list[str] = []
+        prefixes: set[str] = set()
+        for key in sorted(objects):
+            if not key.startswith(prefix):
+                continue
+            if delimiter and delimiter in key[len(prefix) :]:
+                prefixes.add(key[: key.index(delimiter, len(prefix)) + 1])
+                continue
+            data, etag, _, modified = objects[key]
+            contents.append(
+                f"<Contents><Key>{quote(key)}</Key><LastModified>{modified}</LastModified><ETag>&quot;{etag}&quot;</ETag>"
+                f"<Size>{len(data)}</Size><StorageClass>STANDARD</StorageClass></Contents>",
+            )
+        common_prefixes = "".join(
+            f"<CommonPrefixes><Prefix>{quote(common_prefix)}</Prefix></CommonPrefixes>" for common_prefix in sorted(prefixes)
+        )
+        self.reply_xml(
+            f'<ListBucketResult xmlns="{_S3_XMLNS}"><Name></Name><Prefix>{quote(prefix)}</Prefix><KeyCount>{len(contents)}</KeyCount>'
+            f"<MaxKeys>1000</MaxKeys><EncodingType>url</EncodingType><IsTruncated>false</IsTruncated>{''.join(contents)}{common_prefixes}"
+            "</ListBucketResult>",
+        )
+
+    def do_PUT(self) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        bucket, key, query = self.parse()
+        data = self.body()
+        if "versioning" in query:
+            self.server.count("PutBucketVersioning")
+            if b"<Status>Enabled</Status>" in data:
+                self.server.versioning.add(bucket)
+            self.reply(200)
+        elif "lifecycle" in query:
+            self.server.count("PutBucketLifecycle")
+            self.reply(200)
+        elif self.server.count("PutObject", len(data)):
+            self.reply_error(503, "SlowDown", key)
+        else:
+            etag = hashlib.md5(data).hexdigest()  # noqa: S324
+            version_id = str(uuid.uuid4())
+            modified = dt.datetime.now(tz=dt.UTC).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+            with self.server.lock:
+                self.server.buckets.setdefault(bucket, {})[key] = (data, etag, version_id, modified)
+            self.reply(200, headers={"ETag": f'"{etag}"', "x-amz-version-id": version_id})
+
+    def do_POST(self) -> None:
+        if self.path.startswith(_MOCK_PATH):
+            self.server.reset()
+            self.reply(204)
+            return
+        self.body()
+        self.reply_error(501, "NotImplemented")
+
+    def do_DELETE(self) -> None:
+        bucket, key, _ = self.parse()
+        self.server.count("DeleteObject")
+        with self.server.lock:
+            self.server.buckets.get(bucket, {}).pop(key, None)
+        self.reply(204)
+
+
+def main() -> None:
+    argsparser = argparse.ArgumentParser(description="Minimal S3 stand-in for the MinIO client")
+    argsparser.add_argument("--port", type=int, default=19000)
+    argsparser.add_argument("--cert-dir", required=True, help="Directory to write the self-signed TLS certificate to")
+    argsparser.add_argument("--latency", type=float, default=0, help="Delay per request in seconds")
+    argsparser.add_argument("--error-rate", type=float, default=0, help="Share of uploads answered with SlowDown")
+    args = argsparser.parse_args()
+
+    cert_path, key_path = create_certificate(Path(args.cert_dir))
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(cert_path, key_path)
+
+    server = MockS3Server(("127.0.0.1", args.port), args.latency, args.error_rate)
+    server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+    print(f"ready {server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import fnmatch
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import yaml
+
+_TYPE_SHARES: dict[str, float] = {
+    "hostgroups": 0.05,
+    "templategroups": 0.02,
+    "templates": 0.10,
+    "maps": 0.01,
+    "images": 0.01,
+    "mediatypes": 0.01,
+}
+_ITEM_SIZE: int = 96
+_STATIC_RESULTS: dict = {
+    "apiinfo.version": "7.0.0",
+    "user.login": "0424bd59b807674191e7d77572075f33",
+    "user.logout": True,
+    "user.checkAuthentication": True,
+    "auditlog.get": [],
+}
+
+
+class MockZabbixData:
+    def __init__(self, objects: int, payload_size: int) -> None:
+        self.payload_size = payload_size
+
+        counts = {export_type: max(1, int(objects * share)) for export_type, share in _TYPE_SHARES.items()}
+        counts["hosts"] = max(1, objects - sum(counts.values()))
+
+        self.hostgroups = [{"groupid": str(100 + i), "name": f"Host group {i}", "uuid": f"{i:032x}"} for i in range(counts["hostgroups"])]
+        self.templategroups = [
+            {"groupid": str(200_000 + i), "name": f"Template group {i}", "uuid": f"{200_000 + i:032x}"}
+            for i in range(counts["templategroups"])
+        ]
+        self.templates = [
+            {"templateid": str(300_000 + i), "host": f"template-{i}", "name": f"Template {i}", "group": i % counts["templategroups"]}
+            for i in range(counts["templates"])
+        ]
+        self.hosts = [
+            {"hostid": str(1_000_000 + i), "host": f"host-{i}", "name": f"Host {i}", "group": i % counts["hostgroups"]}
+            for i in range(counts["hosts"])
+        ]
+        self.maps = [{"sysmapid": str(i + 1), "name": f"Map {i}"} for i in range(counts["maps"])]
+        self.images = [{"imageid": str(i + 1), "name": f"Image {i}"} for i in range(counts["images"])]
+        self.mediatypes = [{"mediatypeid": str(i + 1), "name": f"Media type {i}"} for i in range(counts["mediatypes"])]
+
+        self.datasets: dict[str, tuple[list[dict], str, str]] = {
+            "hostgroup": (self.hostgroups, "groupid", "groupids"),
+            "templategroup": (self.templategroups, "groupid", "groupids"),
+            "template": (self.templates, "templateid", "templateids"),
+            "host": (self.hosts, "hostid", "hostids"),
+            "map": (self.maps, "sysmapid", "sysmapids"),
+            "image": (self.images, "imageid", "imageids"),
+            "mediatype": (self.mediatypes, "mediatypeid", "mediatypeids"),
+        }
+        self.indexes = {
+            name: {element[id_field]: element for element in elements} for name, (elements, id_field, _) in self.datasets.items()
+        }
+
+    @property
+    def total(self) -> int:
+        return sum(len(elements) for elements, _, _ in self.datasets.values())
+
+    def get(self, method: str, params: dict) -> list[dict] | str:
+        elements, _id_field, ids_param = self.datasets[method]
+        if ids_param in params:
+            index = self.indexes[method]
+            elements = [index[str(element_id)] for element_id in params[ids_param] if str(element_id) in index]
+        elements = self.filtered(method, elements, params)
+        if params.get("countOutput"):
+            return str(len(elements))
+
+        output = params.get("output", "extend")
+        rows = [{key: value for key, value in element.items() if key != "group"} for element in elements]
+        if output != "extend":
+            rows = [{key: row[key] for key in output if key in row} for row in rows]
+        if params.get("limit"):
+            rows = rows[: params["limit"]]
+        return rows
+
+    def filtered(self, method: str, elements: list[dict], params: dict) -> list[dict]:
+        if "groupids" in params and method in {"host", "template"}:
+            groups = self.hostgroups if method == "host" else self.templategroups
+            groupids = {str(groupid) for groupid in params["groupids"]}
+            elements = [element for element in elements if groups[element["group"]]["groupid"] in groupids]
+        for field, value in (params.get("search") or {}).items():
+            pattern = value if params.get("searchWildcardsEnabled") else f"*{value}*"
+            elements = [element for element in elements if fnmatch.fnmatch(element.get(field, "").lower(), pattern.lower())]
+        return elements
+
+    def items(self, seed: str) -> list[dict]:
+        item_random = random.Random(seed)  # noqa: S311
+        return [
+            {
+                "uuid": f"{item_random.getrandbits(128):032x}",
+                "name": f"Item {i}",
+                "key": f"bench.item[{i}]",
+                "delay": f"{item_random.choice([1, 5, 10, 30])}m",
+                "history": "7d",
+            }
+            for i in range(max(1, self.payload_size // _ITEM_SIZE))
+        ]
+
+    def selected(self, method: str, ids: list) -> list[dict]:
+        index = self.indexes[method]
+        return [index[str(element_id)] for element_id in ids if str(element_id) in index]
+
+    def export(self, options: dict, export_format: str) -> str:
+        document: dict = {"version": "7.0"}
+        if options.get("host_groups"):
+            document["host_groups"] = [
+                {"uuid": group["uuid"], "name": group["name"]} for group in self.selected("hostgroup", options["host_groups"])
+            ]
+        if options.get("template_groups"):
+            document["template_groups"] = [
+                {"uuid": group["uuid"], "name": group["name"]} for group in self.selected("templategroup", options["template_groups"])
+            ]
+        if options.get("templates"):
+            templates = self.selected("template", options["templates"])
+            groups = sorted({template["group"] for template in templates})
+            document["template_groups"] = [{"uuid": self.templategroups[i]["uuid"], "name": self.templategroups[i]["name"]} for i in groups]
+            document["templates"] = [
+                {
+                    "uuid": f"{int(template['templateid']):032x}",
+                    "template": template["host"],
+                    "name": template["name"],
+                    "groups": [{"name": self.templategroups[template["group"]]["name"]}],
+                    "items": self.items(template["templateid"]),
+                }
+                for template in templates
+            ]
+        if options.get("hosts"):
+            hosts = self.selected("host", options["hosts"])
+            groups = sorted({host["group"] for host in hosts})
+            document["host_groups"] = [{"uuid": self.hostgroups[i]["uuid"], "name": self.hostgroups[i]["name"]} for i in groups]
+            document["hosts"] = [
+                {
+                    "host": host["host"],
+                    "name": host["name"],
+                    "groups": [{"name": self.hostgroups[host["group"]]["name"]}],
+                    "interfaces": [
+                        {"ip": f"10.{int(host['hostid']) >> 16 & 255}.{int(host['hostid']) >> 8 & 255}.{int(host['hostid']) & 255}"}
+                    ],
+                    "items": self.items(host["hostid"]),
+                }
+                for host in hosts
+            ]
+        if options.get("maps"):
+            document["maps"] = [
+                {"name": sysmap["name"], "width": "800", "height": "600"} for sysmap in self.selected("map", options["maps"])
+            ]
+        if options.get("images"):
+            document["images"] = [
+                {"name": image["name"], "imagetype": "ICON", "encodedImage": "iVBORw0KGgo" * max(1, self.payload_size // 11)}
+                for image in self.selected("image", options["images"])
+            ]
+        if options.get("mediaTypes"):
+            document["media_types"] = [
+                {"name": mediatype["name"], "type": "SCRIPT", "script_name": "notify.sh"}
+                for mediatype in self.selected("mediatype", options["mediaTypes"])
+            ]
+
+        if export_format == "json":
+            return json.dumps({"zabbix_export": document}, indent=4)
+        return yaml.safe_dump({"zabbix_export": document}, sort_keys=False)
+
+
+class MockZabbixServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address: tuple[str, int], data: MockZabbixData, latency: float, error_rate: float) -> None:
+        super().__init__(address, MockZabbixHandler)
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = random.Random(1)  # noqa: S311
+        self.requests: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def call(self, method: str, params: dict) -> tuple[Any, dict | None]:
+        if method.startswith("mock."):
+            return self.control(method), None
+
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            failed = method == "configuration.export" and self.errors.random() < self.error_rate
+        if failed:
+            return None, {"code": -32500, "message": "Application error.", "data": "Injected error"}
+
+        api_object, _, api_method = method.partition(".")
+        if method in _STATIC_RESULTS:
+            return _STATIC_RESULTS[method], None
+        if method == "configuration.export":
+            return self.data.export(params["options"], params.get("format", "yaml")), None
+        if api_method == "get" and api_object in self.data.datasets:
+            return self.data.get(api_object, params), None
+        return None, {"code": -32601, "message": "Method not found.", "data": f'Incorrect method "{method}".'}
+
+    def control(self, method: str) -> dict | bool:
+        with self.lock:
+            if method == "mock.reset":
+                self.requests.clear()
+                return True
+            return {"objects": self.data.total, "requests": dict(self.requests)}
+
+
+class MockZabbixHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockZabbixServer
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        result, error = self.server.call(body["method"], body.get("params") or {})
+
+        response = {"jsonrpc": "2.0", "id": body.get("id")}
+        if error is None:
+            response["result"] = result
+        else:
+            response["error"] = error
+        response_data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_data)))
+        self.end_headers()
+        self.wfile.write(response_data)
+
+
+def main() -> None:
+    argsparser = argparse.ArgumentParser(description="Mock Zabbix JSON-RPC API with a synthetic instance")
+    argsparser.add_argument("--port", type=int, default=18080)
+    argsparser.add_argument("--objects", type=int, default=1000, help="Number of objects over all types")
+    argsparser.add_argument("--payload-size", type=int, default=2048, help="Approximate export size per host/template in bytes")
+    argsparser.add_argument("--latency", type=float, default=0, help="Delay per request in seconds")
+    argsparser.add_argument("--error-rate", type=float, default=0, help="Share of configuration.export calls that fail")
+    args = argsparser.parse_args()
+
+    server = MockZabbixServer(("127.0.0.1", args.port), MockZabbixData(args.objects, args.payload_size), args.latency, args.error_rate)
+    print(f"ready {server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
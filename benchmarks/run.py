@@ -0,0 +1,219 @@
+import argparse
+import dataclasses
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import yaml
+
+_REPO_DIR: Path = Path(__file__).resolve().parent.parent
+_DEFAULT_SIZES: str = "100,1000,10000,50000"
+_EXPORT_TYPES: tuple[str, ...] = ("templates", "templategroups", "hosts", "hostgroups", "maps", "images", "mediatypes")
+
+
+@dataclasses.dataclass
+class Benchmark:
+    args: argparse.Namespace
+    work_dir: Path
+    s3_port: int
+    ssl_context: ssl.SSLContext
+    env: dict[str, str]
+
+
+@contextmanager
+def mock_server(module: str, *args: str) -> Iterator[int]:
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", module, "--port", "0", *args],
+        cwd=_REPO_DIR,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        ready = process.stdout.readline().split()
+        if not ready or ready[0] != "ready":
+            msg = f"{module} did not start"
+            raise RuntimeError(msg)
+        yield int(ready[1])
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def zabbix_call(port: int, method: str) -> dict:
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api_jsonrpc.php",
+        data=json.dumps({"jsonrpc": "2.0", "method": method, "params": {}, "id": 1}).encode(),
+        headers={"Content-Type": "application/json-rpc"},
+    )
+    with urllib.request.urlopen(request) as response:  # noqa: S310
+        return json.loads(response.read())["result"]
+
+
+def s3_call(bench: Benchmark, method: str) -> dict:
+    request = urllib.request.Request(f"https://127.0.0.1:{bench.s3_port}/_mock/stats", method=method)
+    with urllib.request.urlopen(request, context=bench.ssl_context) as response:  # noqa: S310
+        return json.loads(response.read() or "{}")
+
+
+def directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def write_config(bench: Benchmark, size: int, zabbix_port: int, git_remote: Path) -> Path:
+    args = bench.args
+    config_data = {
+        "general": {
+            "loglevel": args.loglevel,
+            "max_threads": args.max_threads,
+            "encryption": args.encryption,
+            "encryption_key": "benchmark",
+            "encryption_format": "aesgcm",
+        },
+        "zabbix": {
+            "url": f"http://127.0.0.1:{zabbix_port}",
+            "auth": {"user": "Admin", "password": "zabbix"},
+            "export_format": args.format,
+        },
+        "inputs": {export_type: {"enable": True, "batch_size": args.batch_size} for export_type in _EXPORT_TYPES},
+        "outputs": {
+            "git": {"enable": "git" in args.outputs, "repo": str(git_remote), "mode": args.git_mode},
+            "s3": {
+                "enable": "s3" in args.outputs,
+                "url": f"127.0.0.1:{bench.s3_port}",
+                "access_key": "benchmark",
+                "secret_key": "benchmark",
+                "bucket": f"benchmark-{size}",
+                "lifecycle": {"enable": True, "days": 30},
+                "retention": {"enable": True, "days": 30},
+            },
+        },
+    }
+    config_file = bench.work_dir / f"config-{size}.yaml"
+    config_file.write_text(yaml.safe_dump(config_data))
+    return config_file
+
+
+def run_scenario(bench: Benchmark, config_file: Path) -> dict:
+    result_file = bench.work_dir / "result.json"
+    result_file.unlink(missing_ok=True)
+    with Path.open(bench.work_dir / "zabbup.log", "a") as log_file:
+        subprocess.run(  # noqa: S603
+            [sys.executable, "-m", "benchmarks.scenario", "-c", str(config_file), "--result", str(result_file)],
+            cwd=_REPO_DIR,
+            env=bench.env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            check=True,
+        )
+    return json.loads(result_file.read_text())
+
+
+def run_size(bench: Benchmark, size: int) -> list[dict]:
+    git_remote = bench.work_dir / f"remote-{size}.git"
+    subprocess.run(["git", "init", "--quiet", "--bare", str(git_remote)], check=True)  # noqa: S603, S607
+
+    results: list[dict] = []
+    zabbix_args = ["--objects", str(size), "--payload-size", str(bench.args.payload_size)]
+    zabbix_args += ["--latency", str(bench.args.latency), "--error-rate", str(bench.args.error_rate)]
+    with mock_server("benchmarks.mock_zabbix", *zabbix_args) as zabbix_port:
+        config_file = write_config(bench, size, zabbix_port, git_remote)
+
+        for run in range(1, bench.args.runs + 1):
+            zabbix_call(zabbix_port, "mock.reset")
+            s3_call(bench, "POST")
+            git_size = directory_size(git_remote)
+
+            result = run_scenario(bench, config_file)
+
+            zabbix_stats = zabbix_call(zabbix_port, "mock.stats")
+            s3_stats = s3_call(bench, "GET")
+            result.update(
+                {
+                    "size": size,
+                    "run": run,
+                    "zabbix_requests": sum(zabbix_stats["requests"].values()),
+                    "zabbix_requests_by_method": zabbix_stats["requests"],
+                    "s3_requests": sum(s3_stats["requests"].values()),
+                    "s3_requests_by_operation": s3_stats["requests"],
+                    "bytes_written_git": directory_size(git_remote) - git_size,
+                    "bytes_written_s3": s3_stats["bytes_written"],
+                },
+            )
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def print_header() -> None:
+    print(
+        f"{'size':>6} {'run':>3} {'objects':>7} {'wall s':>8} {'obj/s':>8} {'zbx req':>7} {'s3 req':>7} "
+        f"{'rss MiB':>7} {'git MiB':>7} {'s3 MiB':>7}  errors",
+    )
+
+
+def print_result(result: dict) -> None:
+    mib = 1024 * 1024
+    print(
+        f"{result['size']:>6} {result['run']:>3} {result['objects']:>7} {result['wall_time']:>8.2f} "
+        f"{result['objects'] / result['wall_time']:>8.1f} {result['zabbix_requests']:>7} {result['s3_requests']:>7} "
+        f"{result['peak_rss'] / mib:>7.1f} {result['bytes_written_git'] / mib:>7.2f} {result['bytes_written_s3'] / mib:>7.2f}  "
+        f"{', '.join(result['errors']) or '-'}",
+        flush=True,
+    )
+
+
+def main() -> None:
+    argsparser = argparse.ArgumentParser(description="End to end benchmark of zabbup against local stand-ins of Zabbix, git and S3")
+    argsparser.add_argument("--sizes", default=_DEFAULT_SIZES, help=f"Comma separated numbers of objects (default: {_DEFAULT_SIZES})")
+    argsparser.add_argument("--runs", type=int, default=1, help="Backup runs per size, later runs measure unchanged data")
+    argsparser.add_argument("--outputs", default="git,s3", help="Comma separated outputs to enable (git, s3)")
+    argsparser.add_argument("--payload-size", type=int, default=2048, help="Approximate export size per host/template in bytes")
+    argsparser.add_argument("--latency", type=float, default=0, help="Delay per Zabbix API request in seconds")
+    argsparser.add_argument("--error-rate", type=float, default=0, help="Share of configuration.export calls that fail")
+    argsparser.add_argument("--s3-latency", type=float, default=0, help="Delay per S3 request in seconds")
+    argsparser.add_argument("--s3-error-rate", type=float, default=0, help="Share of S3 uploads answered with SlowDown")
+    argsparser.add_argument("--format", default="yaml", choices=["yaml", "json"], help="Zabbix export format")
+    argsparser.add_argument("--batch-size", type=int, default=1, help="Objects per configuration.export call")
+    argsparser.add_argument("--max-threads", type=int, default=10, help="general.max_threads of the benchmarked run")
+    argsparser.add_argument("--git-mode", default="worktree", choices=["worktree", "plumbing"], help="outputs.git.mode")
+    argsparser.add_argument("--encryption", action="store_true", help="Encrypt all exported objects")
+    argsparser.add_argument("--loglevel", default="WARNING", help="Log level of the benchmarked runs")
+    argsparser.add_argument("--work-dir", help="Keep configs, remotes and logs in this directory instead of a temporary one")
+    argsparser.add_argument("--json", help="Write all measurements to this file")
+    args = argsparser.parse_args()
+    args.outputs = set(args.outputs.split(","))
+
+    with tempfile.TemporaryDirectory(prefix="zabbup-bench-") as temp_dir:
+        work_dir = Path(args.work_dir or temp_dir)
+        Path.mkdir(work_dir, parents=True, exist_ok=True)
+
+        s3_args = ["--cert-dir", str(work_dir), "--latency", str(args.s3_latency), "--error-rate", str(args.s3_error_rate)]
+        with mock_server("benchmarks.mock_s3", *s3_args) as s3_port:
+            env = {
+                **os.environ,
+                "SSL_CERT_FILE": str(work_dir / "mock_s3.crt"),
+                "GIT_AUTHOR_NAME": "zabbup benchmark",
+                "GIT_AUTHOR_EMAIL": "benchmark@localhost",
+                "GIT_COMMITTER_NAME": "zabbup benchmark",
+                "GIT_COMMITTER_EMAIL": "benchmark@localhost",
+            }
+            bench = Benchmark(args, work_dir, s3_port, ssl.create_default_context(cafile=work_dir / "mock_s3.crt"), env)
+
+            print_header()
+            results: list[dict] = []
+            for size in (int(size) for size in args.sizes.split(",")):
+                results += run_size(bench, size)
+
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
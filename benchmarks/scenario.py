@@ -0,0 +1,65 @@
+import json
+import resource
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import zabbix_utils
+
+import modules.outputs.git
+import modules.outputs.s3
+from modules.config import config
+from modules.inputs.zapi_configuration_export import zconfig_export
+from modules.models import ExportObject
+from modules.pipeline import run_pipeline
+from modules.zapi import zapi_pool
+
+
+class ExportCounter:
+    def __init__(self, data: Iterator[ExportObject]) -> None:
+        self.data = data
+        self.objects: int = 0
+        self.bytes_exported: int = 0
+
+    def __iter__(self) -> Iterator[ExportObject]:
+        for exportdata in self.data:
+            self.objects += 1
+            self.bytes_exported += len(exportdata.data or b"")
+            yield exportdata
+
+
+def main() -> None:
+    config.add_argument("--result", required=True, help="File to write the measurements to")
+    config.load_data()
+
+    start = time.perf_counter()
+    exported = ExportCounter(zconfig_export())
+    errors: dict[str, str] = {}
+    try:
+        output_errors = run_pipeline(
+            exported,
+            {
+                "Git": modules.outputs.git.export_git,
+                "S3": modules.outputs.s3.export_s3,
+            },
+        )
+        errors.update({output_name: repr(e) for output_name, e in output_errors.items()})
+    except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+        errors["Zabbix"] = repr(e)
+    finally:
+        zapi_pool.close()
+    wall_time = time.perf_counter() - start
+
+    result = {
+        "wall_time": wall_time,
+        "objects": exported.objects,
+        "bytes_exported": exported.bytes_exported,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_rss_children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        "errors": errors,
+    }
+    Path(config.args.result).write_text(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import contextlib
+import datetime as dt
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from modules.config import config
+from modules.logger import get_logger
+
+_CATALOG_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT NOT NULL,
+    output TEXT NOT NULL,
+    created REAL NOT NULL,
+    complete INTEGER NOT NULL,
+    location TEXT,
+    PRIMARY KEY (run_id, output)
+);
+CREATE TABLE IF NOT EXISTS objects (
+    run_id TEXT NOT NULL,
+    output TEXT NOT NULL,
+    created REAL NOT NULL,
+    type TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT,
+    location TEXT NOT NULL,
+    version TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+CREATE INDEX IF NOT EXISTS objects_run ON objects (run_id, output);
+CREATE INDEX IF NOT EXISTS objects_object ON objects (type, object_id, created);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS objects_created ON objects (created);
+"""
+
+
+def catalog_run_id(created: float) -> str:
+    return f"{dt.datetime.fromtimestamp(created, tz=dt.UTC):%Y%m%dT%H%M%S%fZ}"
+
+
+class Catalog:
+    def __init__(self, path: str | None = None) -> None:
+        self.path = Path(path or config.general.catalog.path)
+        Path.mkdir(self.path.parent, parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(_CATALOG_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add_run(self, run: "CatalogRun") -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM objects WHERE run_id = ? AND output = ?", (run.run_id, run.output))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs (run_id, output, created, complete, location) VALUES (?, ?, ?, ?, ?)",
+                (run.run_id, run.output, run.created, run.complete, run.location),
+            )
+            self.connection.executemany(
+                "INSERT INTO objects (run_id, output, created, type, object_id, name, hash, location, version, deleted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run.run_id, run.output, run.created, *entry) for entry in run.objects],
+            )
+
+    def clear(self, output: str) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM objects WHERE output = ?", (output,))
+            self.connection.execute("DELETE FROM runs WHERE output = ?", (output,))
+
+    def runs(self, **filters: str | float | None) -> list[sqlite3.Row]:
+        query, params = self.filters(filters)
+        objects_count = "SELECT COUNT(*) FROM objects WHERE objects.run_id = runs.run_id AND objects.output = runs.output"
+        return self.connection.execute(f"SELECT runs.*, ({objects_count}) AS objects FROM runs{query} ORDER BY created", params).fetchall()  # noqa: S608
+
+    def objects(self, **filters: str | float | None) -> list[sqlite3.Row]:
+        query, params = self.filters(filters)
+        return self.connection.execute(f"SELECT * FROM objects{query} ORDER BY created, type, name", params).fetchall()  # noqa: S608
+
+    def filters(self, filters: dict[str, str | float | None]) -> tuple[str, list]:
+        conditions: list = []
+        params: list = []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column == "name":
+                conditions.append("name LIKE ? ESCAPE '\\'")
+                params.append(value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "%").replace("?", "_"))
+            elif column == "since":
+                conditions.append("created >= ?")
+                params.append(value)
+            elif column == "until":
+                conditions.append("created < ?")
+                params.append(value)
+            elif column in {"type", "object_id", "output"}:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return (f" WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+class CatalogRun:
+    def __init__(self, output: str, created: float | None = None) -> None:
+        self.output = output
+        self.created = time.time() if created is None else created
+        self.run_id = catalog_run_id(self.created)
+        self.location: str | None = None
+        self.complete: bool = True
+        self.objects: list[tuple] = []
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return config.general.catalog.enable
+
+    def add(self, object_type: str, object_id: str, name: str, content_hash: str, location: str) -> None:
+        with self.lock:
+            self.objects.append((object_type, str(object_id), name, content_hash, location, None, False))
+
+    def remove(self, object_type: str, object_id: str, name: str, location: str) -> None:
+        with self.lock:
+            self.objects.append((object_type, str(object_id), name, None, location, None, True))
+
+    def set_versions(self, versions: dict[str, str | None] | str) -> None:
+        with self.lock:
+            self.objects = [
+                (*entry[:5], entry[5] or (versions if isinstance(versions, str) else versions.get(entry[4])), entry[6])
+                for entry in self.objects
+            ]
+
+    def discard(self, locations: Iterable[str]) -> None:
+        locations = set(locations)
+        with self.lock:
+            self.objects = [entry for entry in self.objects if entry[4] not in locations]
+
+    def save(self, location: str, *, complete: bool) -> None:
+        if not self.enabled or not self.objects:
+            return
+
+        logger = get_logger()
+        self.location = location
+        self.complete = complete
+        try:
+            with contextlib.closing(Catalog()) as catalog:
+                catalog.add_run(self)
+        except sqlite3.Error as e:
+            logger.warning(f"Catalog: Recording {self.output} run {self.run_id} failed: {e}")
+        else:
+            logger.debug(f"Catalog: {len(self.objects)} {self.output} objects recorded for run {self.run_id}")
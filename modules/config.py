@@ -1,11 +1,19 @@
 import logging
+import re
+import threading
 from argparse import ArgumentParser
 from pathlib import Path
 
 import yaml
-from pydantic import BaseModel, ConfigDict, field_validator, model_validator
-
-from modules.exceptions import NotAllowedValueError, UnknownConfigAttributeError, UnknownLogLevelError, ZabbixAuthConfigError
+from pydantic import BaseModel, ConfigDict, ValidationInfo, field_validator, model_validator
+
+from modules.exceptions import (
+    NotAllowedValueError,
+    ThrottleEngineConfigError,
+    UnknownConfigAttributeError,
+    UnknownLogLevelError,
+    ZabbixAuthConfigError,
+)
 from modules.logger import get_logger, set_log_level
 
 ###################################################################
@@ -24,14 +32,93 @@ loglevel_map = {
 ###################################################################
 
 
-class GeneralConfig(BaseModel):
+class FrozenModel(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+
+class IncrementalConfig(FrozenModel):
+    enable: bool = False
+    state_file: str = "zabbup-state.json"
+    full_run_interval: int = 86400
+
+
+class WatchConfig(FrozenModel):
+    interval: int = 60
+    window: int = 30
+    state_file: str = "zabbup-watch.json"
+
+
+class CatalogConfig(FrozenModel):
+    enable: bool = False
+    path: str = "zabbup-catalog.db"
+
+
+class JournalConfig(FrozenModel):
+    enable: bool = False
+    path: str = "zabbup-journal"
+
+
+class MetricsTrapperConfig(FrozenModel):
+    enable: bool = False
+    server: str = "127.0.0.1"
+    port: int = 10051
+    host: str = "zabbup"
+
+
+class MetricsConfig(FrozenModel):
+    json_file: str | None = None
+    textfile: str | None = None
+    trapper: MetricsTrapperConfig = MetricsTrapperConfig()
+
+
+class ThrottleConfig(FrozenModel):
+    adaptive: bool = False
+    min_threads: int = 1
+    target_latency: float = 5.0
+    decrease_factor: float = 0.5
+    max_rps: float | None = None
+    burst: int | None = None
+
+    @field_validator("min_threads", "burst")
+    def check_positive(cls, value: int | None) -> int | None:
+        if value is not None and value < 1:
+            raise NotAllowedValueError(value, [">= 1"])
+        return value
+
+    @field_validator("target_latency", "max_rps")
+    def check_positive_float(cls, value: float | None) -> float | None:
+        if value is not None and value <= 0:
+            raise NotAllowedValueError(value, ["> 0"])
+        return value
+
+    @field_validator("decrease_factor")
+    def check_decrease_factor(cls, value: float) -> float:
+        if not 0 < value < 1:
+            raise NotAllowedValueError(value, ["> 0 and < 1"])
+        return value
+
+
+class GeneralConfig(FrozenModel):
     loglevel: str = "INFO"
     loglevel_numeric: int = logging.INFO
     dryrun: bool = False
     max_threads: int | None = 10
+    page_size: int = 1000
+    queue_size: int = 100
+    input_engine: str = "threads"
+    max_async_requests: int = 100
+    export_retries: int = 2
+    incremental: IncrementalConfig = IncrementalConfig()
+    watch: WatchConfig = WatchConfig()
+    catalog: CatalogConfig = CatalogConfig()
+    journal: JournalConfig = JournalConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    throttle: ThrottleConfig = ThrottleConfig()
     encryption: bool = False
     encryption_key: str | None
     encryption_deterministic: bool = False
+    encryption_format: str = "fernet"
+    encryption_compress: bool = True
 
     @model_validator(mode="before")
     def convert_loglevel(cls, values: dict) -> dict:
@@ -44,8 +131,34 @@ class GeneralConfig(BaseModel):
             values["loglevel_numeric"] = loglevel_map[loglevel.upper()]
         return values
 
+    @field_validator("input_engine")
+    def check_input_engine(cls, value: str) -> str:
+        allowed_engines = {"threads", "asyncio"}
+        if value not in allowed_engines:
+            raise NotAllowedValueError(value, allowed_engines)
+        return value
+
+    @field_validator("encryption_format")
+    def check_encryption_format(cls, value: str) -> str:
+        allowed_formats = {"fernet", "aesgcm"}
+        if value not in allowed_formats:
+            raise NotAllowedValueError(value, allowed_formats)
+        return value
+
+    @field_validator("export_retries")
+    def check_export_retries(cls, value: int) -> int:
+        if value < 0:
+            raise NotAllowedValueError(value, [">= 0"])
+        return value
+
+    @field_validator("throttle")
+    def check_throttle(cls, value: ThrottleConfig, info: ValidationInfo) -> ThrottleConfig:
+        if info.data.get("input_engine") == "asyncio" and (value.adaptive or value.max_rps):
+            raise ThrottleEngineConfigError(info.data["input_engine"])
+        return value
+
 
-class ZabbixAuthConfig(BaseModel):
+class ZabbixAuthConfig(FrozenModel):
     user: str | None = None
     password: str | None = None
     token: str | None = None
@@ -63,7 +176,7 @@ class ZabbixAuthConfig(BaseModel):
         return values
 
 
-class ZabbixConfig(BaseModel):
+class ZabbixConfig(FrozenModel):
     url: str
     auth: ZabbixAuthConfig
     export_format: str | None = "yaml"
@@ -76,56 +189,69 @@ class ZabbixConfig(BaseModel):
         return value
 
 
-class TemplatesConfig(BaseModel):
+class ExportTypeConfig(FrozenModel):
     enable: bool
     encryption: bool | None = None
     encryption_deterministic: bool | None = None
     excludes: list[str] | None = []
+    api_filter: dict = {}
+    batch_size: int = 1
+    priority: int | None = None
+    max_threads: int | None = None
+
+    @field_validator("excludes")
+    def check_excludes(cls, value: list[str] | None) -> list[str] | None:
+        for pattern in value or []:
+            try:
+                re.compile(pattern)
+            except re.error:
+                raise NotAllowedValueError(pattern, ["regular expressions"]) from None
+        return value
 
+    @field_validator("api_filter")
+    def check_api_filter(cls, value: dict) -> dict:
+        reserved_params = {"output", "limit", "countOutput", "preservekeys", "sortfield", "sortorder"}
+        for param in value:
+            if param in reserved_params or param.startswith("select"):
+                raise NotAllowedValueError(param, ["*.get filter parameters like groupids, templateids, tags, search, filter"])
+        return value
 
-class TemplategroupsConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+    @field_validator("batch_size")
+    def check_batch_size(cls, value: int) -> int:
+        if value < 1:
+            raise NotAllowedValueError(value, [">= 1"])
+        return value
 
 
-class HostsConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+class TemplatesConfig(ExportTypeConfig):
+    pass
 
 
-class HostgroupsConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+class TemplategroupsConfig(ExportTypeConfig):
+    pass
 
 
-class MapsConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+class HostsConfig(ExportTypeConfig):
+    pass
 
 
-class ImagesConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+class HostgroupsConfig(ExportTypeConfig):
+    pass
 
 
-class MediatypesConfig(BaseModel):
-    enable: bool
-    encryption: bool | None = None
-    encryption_deterministic: bool | None = None
-    excludes: list[str] | None = []
+class MapsConfig(ExportTypeConfig):
+    pass
+
 
+class ImagesConfig(ExportTypeConfig):
+    pass
 
-class InputsConfig(BaseModel):
+
+class MediatypesConfig(ExportTypeConfig):
+    pass
+
+
+class InputsConfig(FrozenModel):
     templates: TemplatesConfig
     templategroups: TemplategroupsConfig
     hosts: HostsConfig
@@ -139,44 +265,108 @@ class InputsConfig(BaseModel):
             if key in self.__dict__[attr].__dict__ and self.__dict__[attr].__dict__[key] is None:
                 self.__dict__[attr].__dict__[key] = value
 
-class GitConfig(BaseModel):
+
+class GitConfig(FrozenModel):
     enable: bool
     repo: str
+    cache_dir: str | None = None
+    mode: str = "worktree"
+
+    @field_validator("mode")
+    def check_mode(cls, value: str) -> str:
+        allowed_modes = {"worktree", "plumbing"}
+        if value not in allowed_modes:
+            raise NotAllowedValueError(value, allowed_modes)
+        return value
 
 
-class S3LifecycleConfig(BaseModel):
+class S3LifecycleConfig(FrozenModel):
     enable: bool
     days: int
 
 
-class S3RetentionConfig(BaseModel):
+class S3RetentionConfig(FrozenModel):
     enable: bool
     days: int
 
 
-class S3Config(BaseModel):
+class S3Config(FrozenModel):
     enable: bool
     url: str
     access_key: str
     secret_key: str
     bucket: str
     bucket_path: str | None = "."
+    manifest: bool = True
+    max_uploads: int = 8
+    max_retries: int = 5
     lifecycle: S3LifecycleConfig
     retention: S3RetentionConfig
 
 
-class OutputsConfig(BaseModel):
+class ArchiveConfig(FrozenModel):
+    enable: bool = False
+    storage: str = "local"
+    path: str = "."
+    encryption: bool = False
+    compresslevel: int = 6
+    part_size: int = 16 * 1024 * 1024
+
+    @field_validator("storage")
+    def check_storage(cls, value: str) -> str:
+        allowed_storages = {"local", "s3"}
+        if value not in allowed_storages:
+            raise NotAllowedValueError(value, allowed_storages)
+        return value
+
+
+class StoreConfig(FrozenModel):
+    enable: bool = False
+    storage: str = "local"
+    path: str = "."
+    keep_snapshots: int = 30
+
+    @field_validator("storage")
+    def check_storage(cls, value: str) -> str:
+        allowed_storages = {"local", "s3"}
+        if value not in allowed_storages:
+            raise NotAllowedValueError(value, allowed_storages)
+        return value
+
+    @field_validator("keep_snapshots")
+    def check_keep_snapshots(cls, value: int) -> int:
+        if value < 1:
+            raise NotAllowedValueError(value, [">= 1"])
+        return value
+
+
+class OutputsConfig(FrozenModel):
     git: GitConfig
     s3: S3Config
+    archive: ArchiveConfig = ArchiveConfig()
+    store: StoreConfig = StoreConfig()
+
 
+class RestoreConfig(FrozenModel):
+    max_threads: int = 4
+    batch_size: int = 50
+    rules: dict[str, dict[str, bool]] = {}
 
-class Configuration(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    @field_validator("max_threads", "batch_size")
+    def check_positive(cls, value: int) -> int:
+        if value < 1:
+            raise NotAllowedValueError(value, [">= 1"])
+        return value
+
+
+class Configuration(FrozenModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
     general: GeneralConfig
     zabbix: ZabbixConfig
     inputs: InputsConfig
     outputs: OutputsConfig
+    restore: RestoreConfig = RestoreConfig()
 
 
 ###################################################################
@@ -193,8 +383,11 @@ class ConfigParser:
             help=f"Configuration file (default: {self.config_file})",
             required=False,
         )
+        self.data: Configuration | None = None
+        self.input_settings: dict[str, ExportTypeConfig] = {}
+        self.lock = threading.Lock()
 
-    def load_data(self) -> Configuration:
+    def parse_data(self) -> Configuration:
         self.args = self.argsparser.parse_args()
         self.config_file = self.args.config
         with Path.open(self.config_file, "r") as file:
@@ -208,9 +401,31 @@ class ConfigParser:
 
         return config_data
 
+    def set_data(self, config_data: Configuration) -> Configuration:
+        self.input_settings = dict(config_data.inputs)
+        self.data = config_data
+        return config_data
+
+    def load_data(self) -> Configuration:
+        if self.data is None:
+            with self.lock:
+                if self.data is None:
+                    self.set_data(self.parse_data())
+        return self.data
+
+    def reload(self) -> Configuration:
+        with self.lock:
+            return self.set_data(self.parse_data())
+
+    def override(self, section: str, **values: object) -> Configuration:
+        config_data = self.load_data()
+        with self.lock:
+            section_data = getattr(config_data, section).model_copy(update=values)
+            return self.set_data(config_data.model_copy(update={section: section_data}))
+
     def __getattr__(self, name: str) -> BaseModel:
         config_data = self.load_data()
-        if hasattr(config_data, name):
+        if name in Configuration.model_fields:
             return getattr(config_data, name)
         raise UnknownConfigAttributeError(name)
 
@@ -1,8 +1,27 @@
 import base64
+import functools
 import hashlib
+import hmac
 import os
+import struct
+import zlib
+from typing import BinaryIO
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from modules.exceptions import ContainerAuthenticationError, ContainerFormatError, ContainerTruncatedError, ContainerVersionError
+
+CONTAINER_MAGIC: bytes = b"ZBUP"
+CONTAINER_VERSION: int = 1
+CONTAINER_FLAG_COMPRESSED: int = 0x01
+CONTAINER_CHUNK_SIZE: int = 64 * 1024
+CONTAINER_HEADER = struct.Struct(">4sBB8sI")
+CONTAINER_SEGMENT = struct.Struct(">I")
+CONTAINER_TAG_SIZE: int = 16
 
 
 def convert_key(key: str) -> bytes:
@@ -28,11 +47,186 @@ class FernetDeterministic(Fernet):
         return self._encrypt_from_parts(data, current_time, iv)
 
 
-def encrypt(content: str, key: str, *, deterministic: bool = False) -> bytes:
-    f = FernetDeterministic(key=convert_key(key), deterministic=deterministic)
-    return f.encrypt(content.encode())
+@functools.lru_cache(maxsize=16)
+def get_cipher(key: str, *, deterministic: bool = False) -> FernetDeterministic:
+    return FernetDeterministic(key=convert_key(key), deterministic=deterministic)
+
+
+@functools.lru_cache(maxsize=16)
+def get_container_keys(key: str) -> tuple[AESGCM, bytes]:
+    key_material = HKDF(algorithm=SHA256(), length=64, salt=None, info=b"zabbup container v1").derive(key.encode())
+    return AESGCM(key_material[:32]), key_material[32:]
+
+
+def container_nonce(nonce_prefix: bytes, index: int) -> bytes:
+    return nonce_prefix + struct.pack(">I", index)
+
+
+def container_aad(header: bytes, *, last: bool) -> bytes:
+    return header + (b"\x01" if last else b"\x00")
+
+
+class ContainerEncryptor:
+    def __init__(
+        self,
+        key: str,
+        *,
+        compress: bool = False,
+        nonce_prefix: bytes | None = None,
+        chunk_size: int = CONTAINER_CHUNK_SIZE,
+    ) -> None:
+        self.aead, _ = get_container_keys(key)
+        self.chunk_size = chunk_size
+        self.nonce_prefix = nonce_prefix or os.urandom(8)
+        self.header = CONTAINER_HEADER.pack(
+            CONTAINER_MAGIC,
+            CONTAINER_VERSION,
+            CONTAINER_FLAG_COMPRESSED if compress else 0,
+            self.nonce_prefix,
+            chunk_size,
+        )
+        self.compressor = zlib.compressobj() if compress else None
+        self.buffer = bytearray()
+        self.index: int = 0
+        self.started = False
+
+    def segment(self, chunk: bytes, *, last: bool) -> bytes:
+        ciphertext = self.aead.encrypt(container_nonce(self.nonce_prefix, self.index), chunk, container_aad(self.header, last=last))
+        self.index += 1
+        return CONTAINER_SEGMENT.pack(len(ciphertext)) + ciphertext
+
+    def update(self, data: bytes) -> bytes:
+        output = bytearray()
+        if not self.started:
+            output += self.header
+            self.started = True
+
+        self.buffer += self.compressor.compress(data) if self.compressor else data
+        while len(self.buffer) > self.chunk_size:
+            output += self.segment(bytes(self.buffer[: self.chunk_size]), last=False)
+            del self.buffer[: self.chunk_size]
+        return bytes(output)
+
+    def finalize(self) -> bytes:
+        output = bytearray(self.update(b""))
+        if self.compressor:
+            self.buffer += self.compressor.flush()
+        while len(self.buffer) > self.chunk_size:
+            output += self.segment(bytes(self.buffer[: self.chunk_size]), last=False)
+            del self.buffer[: self.chunk_size]
+        output += self.segment(bytes(self.buffer), last=True)
+        self.buffer.clear()
+        return bytes(output)
+
+
+class ContainerDecryptor:
+    def __init__(self, key: str) -> None:
+        self.aead, _ = get_container_keys(key)
+        self.buffer = bytearray()
+        self.header: bytes | None = None
+        self.nonce_prefix: bytes = b""
+        self.decompressor: zlib._Decompress | None = None
+        self.pending: bytes | None = None
+        self.index: int = 0
+
+    def segment(self, ciphertext: bytes, *, last: bool) -> bytes:
+        try:
+            chunk = self.aead.decrypt(container_nonce(self.nonce_prefix, self.index), ciphertext, container_aad(self.header, last=last))
+        except InvalidTag:
+            raise ContainerAuthenticationError from None
+        self.index += 1
+        return self.decompressor.decompress(chunk) if self.decompressor else chunk
+
+    def update(self, data: bytes) -> bytes:
+        self.buffer += data
+        if self.header is None:
+            if len(self.buffer) < CONTAINER_HEADER.size:
+                return b""
+            magic, version, flags, self.nonce_prefix, _ = CONTAINER_HEADER.unpack_from(self.buffer)
+            if magic != CONTAINER_MAGIC:
+                raise ContainerFormatError
+            if version != CONTAINER_VERSION:
+                raise ContainerVersionError(version)
+            self.header = bytes(self.buffer[: CONTAINER_HEADER.size])
+            self.decompressor = zlib.decompressobj() if flags & CONTAINER_FLAG_COMPRESSED else None
+            del self.buffer[: CONTAINER_HEADER.size]
+
+        output = bytearray()
+        while len(self.buffer) >= CONTAINER_SEGMENT.size:
+            (length,) = CONTAINER_SEGMENT.unpack_from(self.buffer)
+            if len(self.buffer) < CONTAINER_SEGMENT.size + length:
+                break
+            if self.pending is not None:
+                output += self.segment(self.pending, last=False)
+            self.pending = bytes(self.buffer[CONTAINER_SEGMENT.size : CONTAINER_SEGMENT.size + length])
+            del self.buffer[: CONTAINER_SEGMENT.size + length]
+        return bytes(output)
+
+    def finalize(self) -> bytes:
+        if self.header is None or self.pending is None or self.buffer:
+            raise ContainerTruncatedError
+        output = self.segment(self.pending, last=True)
+        self.pending = None
+        if self.decompressor:
+            output += self.decompressor.flush()
+        return output
+
+
+class ContainerWriter:
+    def __init__(self, raw: BinaryIO, key: str, *, chunk_size: int = CONTAINER_CHUNK_SIZE) -> None:
+        self.raw = raw
+        self.encryptor = ContainerEncryptor(key, chunk_size=chunk_size)
+
+    def write(self, data: bytes) -> int:
+        self.raw.write(self.encryptor.update(data))
+        return len(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def close(self) -> None:
+        self.raw.write(self.encryptor.finalize())
+        self.raw.flush()
+
+
+def encrypt_container(content: bytes, key: str, *, compress: bool = False, deterministic: bool = False) -> bytes:
+    nonce_prefix = None
+    if deterministic:
+        _, mac_key = get_container_keys(key)
+        nonce_prefix = hmac.new(mac_key, content, hashlib.sha256).digest()[:8]
+    encryptor = ContainerEncryptor(key, compress=compress, nonce_prefix=nonce_prefix)
+    return encryptor.update(content) + encryptor.finalize()
+
+
+def decrypt_container(content: bytes, key: str) -> bytes:
+    decryptor = ContainerDecryptor(key)
+    return decryptor.update(content) + decryptor.finalize()
+
+
+def decrypt_stream(source: BinaryIO, target: BinaryIO, key: str) -> None:
+    head = source.read(len(CONTAINER_MAGIC))
+    if head != CONTAINER_MAGIC:
+        target.write(get_cipher(key).decrypt(head + source.read()))
+        return
+
+    decryptor = ContainerDecryptor(key)
+    target.write(decryptor.update(head))
+    while chunk := source.read(CONTAINER_CHUNK_SIZE):
+        target.write(decryptor.update(chunk))
+    target.write(decryptor.finalize())
+
+
+def is_encrypted(content: bytes) -> bool:
+    return content.startswith((CONTAINER_MAGIC, b"gAAAAA"))
+
+
+def encrypt(content: bytes, key: str, *, deterministic: bool = False, container: bool = False, compress: bool = False) -> bytes:
+    if container:
+        return encrypt_container(content, key, compress=compress, deterministic=deterministic)
+    return get_cipher(key, deterministic=deterministic).encrypt(content)
 
 
 def decrypt(content: bytes, key: str, *, deterministic: bool = False) -> str:
-    f = FernetDeterministic(key=convert_key(key), deterministic=deterministic)
-    return f.decrypt(content).decode()
+    if content.startswith(CONTAINER_MAGIC):
+        return decrypt_container(content, key).decode()
+    return get_cipher(key, deterministic=deterministic).decrypt(content).decode()
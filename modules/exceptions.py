@@ -1,5 +1,8 @@
+from typing import Any
+
+
 class NotAllowedValueError(Exception):
-    def __init__(self, value: any, allowed_values: list[any]) -> None:
+    def __init__(self, value: object, allowed_values: list[Any]) -> None:
         self.value = value
         self.allowed_values = allowed_values
 
@@ -8,7 +11,7 @@ class NotAllowedValueError(Exception):
 
 
 class UnknownLogLevelError(Exception):
-    def __init__(self, value: any, allowed_values: list) -> None:
+    def __init__(self, value: object, allowed_values: list) -> None:
         self.value = value
         self.allowed_values = allowed_values
 
@@ -27,3 +30,113 @@ class UnknownConfigAttributeError(Exception):
 class ZabbixAuthConfigError(Exception):
     def __str__(self) -> str:
         return "You have to set token or username/password for Zabbix API"
+
+
+class ThrottleEngineConfigError(Exception):
+    def __init__(self, input_engine: str) -> None:
+        self.input_engine = input_engine
+
+    def __str__(self) -> str:
+        return f"throttle.adaptive and throttle.max_rps are not supported with input_engine '{self.input_engine}', use max_async_requests"
+
+
+class ExportSplitError(Exception):
+    def __str__(self) -> str:
+        return "Export cannot be split into single objects"
+
+
+class ExportSectionMissingError(ExportSplitError):
+    def __init__(self, section: str) -> None:
+        self.section = section
+
+    def __str__(self) -> str:
+        return f"Section '{self.section}' is missing in export"
+
+
+class ExportSectionNotSplittableError(ExportSplitError):
+    def __init__(self, section: str) -> None:
+        self.section = section
+
+    def __str__(self) -> str:
+        return f"Section '{self.section}' cannot be attributed to single objects"
+
+
+class ExportObjectMismatchError(ExportSplitError):
+    def __init__(self, expected: list[str], found: list[str]) -> None:
+        self.expected = expected
+        self.found = found
+
+    def __str__(self) -> str:
+        return f"Export contains objects [{', '.join(self.found)}] but [{', '.join(self.expected)}] were requested"
+
+
+class ExportParseError(ExportSplitError):
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+    def __str__(self) -> str:
+        return f"Export cannot be parsed: {self.error}"
+
+
+class ExportStreamAbortedError(Exception):
+    def __str__(self) -> str:
+        return "Export was aborted before all objects were delivered"
+
+
+class S3UploadError(Exception):
+    def __init__(self, object_names: list[str]) -> None:
+        self.object_names = object_names
+
+    def __str__(self) -> str:
+        return f"{len(self.object_names)} files could not be uploaded: {', '.join(self.object_names[:10])}"
+
+
+class EncryptedContainerError(Exception):
+    pass
+
+
+class ContainerFormatError(EncryptedContainerError):
+    def __str__(self) -> str:
+        return "Data is not an encrypted container"
+
+
+class ContainerVersionError(EncryptedContainerError):
+    def __init__(self, version: int) -> None:
+        self.version = version
+
+    def __str__(self) -> str:
+        return f"Encrypted container version {self.version} is not supported"
+
+
+class ContainerAuthenticationError(EncryptedContainerError):
+    def __str__(self) -> str:
+        return "Encrypted container cannot be authenticated (wrong key or damaged data)"
+
+
+class ContainerTruncatedError(EncryptedContainerError):
+    def __str__(self) -> str:
+        return "Encrypted container is truncated"
+
+
+class RestoreSourceError(Exception):
+    def __init__(self, source: str) -> None:
+        self.source = source
+
+    def __str__(self) -> str:
+        return f"Restore source '{self.source}' is neither a directory nor an s3://<bucket>/<prefix> URL"
+
+
+class RestorePathError(Exception):
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __str__(self) -> str:
+        return f"Path '{self.path}' is outside of the restore target"
+
+
+class RestoreSnapshotNotFoundError(Exception):
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __str__(self) -> str:
+        return f"Snapshot '{self.name}' not found in store"
@@ -0,0 +1,13 @@
+import importlib
+from types import ModuleType
+
+from modules.config import config
+
+_INPUT_ENGINES: dict = {
+    "threads": "modules.inputs.zapi_configuration_export",
+    "asyncio": "modules.inputs.zapi_configuration_export_async",
+}
+
+
+def get_input_engine() -> ModuleType:
+    return importlib.import_module(_INPUT_ENGINES[config.general.input_engine])
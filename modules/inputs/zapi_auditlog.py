@@ -0,0 +1,147 @@
+import json
+import time
+from pathlib import Path
+
+from modules.config import config
+from modules.logger import get_logger
+from modules.models import ExportObject
+from modules.zapi import zapi_pool
+
+_AUDIT_ACTION_DELETE: str = "2"
+
+_AUDIT_RESOURCE_TYPES: dict = {
+    "3": "mediatypes",
+    "4": "hosts",
+    "14": "hostgroups",
+    "16": "images",
+    "19": "maps",
+    "30": "templates",
+    "50": "templategroups",
+}
+
+_AUDIT_OWNED_RESOURCE_TYPES: dict = {
+    "6": {"api_method_name": "graph", "api_ids_param": "graphids", "api_params": {"selectHosts": ["hostid"]}},
+    "13": {"api_method_name": "trigger", "api_ids_param": "triggerids", "api_params": {"selectHosts": ["hostid"]}},
+    "15": {"api_method_name": "item", "api_ids_param": "itemids", "api_params": {"output": ["hostid"]}},
+    "22": {"api_method_name": "httptest", "api_ids_param": "httptestids", "api_params": {"output": ["hostid"]}},
+    "23": {"api_method_name": "discoveryrule", "api_ids_param": "itemids", "api_params": {"output": ["hostid"]}},
+    "31": {"api_method_name": "triggerprototype", "api_ids_param": "triggerids", "api_params": {"selectHosts": ["hostid"]}},
+    "35": {"api_method_name": "graphprototype", "api_ids_param": "graphids", "api_params": {"selectHosts": ["hostid"]}},
+    "36": {"api_method_name": "itemprototype", "api_ids_param": "itemids", "api_params": {"output": ["hostid"]}},
+    "37": {"api_method_name": "hostprototype", "api_ids_param": "hostids", "api_params": {"selectDiscoveryRule": ["hostid"]}},
+    "43": {"api_method_name": "templatedashboard", "api_ids_param": "dashboardids", "api_params": {"output": ["templateid"]}},
+}
+
+
+def auditlog_owner_ids(row: dict) -> set:
+    owner_ids: set = set()
+    for field in ("hostid", "templateid"):
+        if field in row:
+            owner_ids.add(row[field])
+    for host in row.get("hosts", []):
+        owner_ids.add(host["hostid"])
+    if isinstance(row.get("discoveryRule"), dict):
+        owner_ids.add(row["discoveryRule"]["hostid"])
+    return owner_ids
+
+
+class AuditLogWatcher:
+    def __init__(self) -> None:
+        self.clock: int = 0
+        self.auditids: set = set()
+
+    def load(self) -> None:
+        logger = get_logger()
+        state_file = Path(config.general.watch.state_file)
+        if state_file.exists():
+            with Path.open(state_file, "r") as file:
+                state = json.load(file)
+            self.clock = state["clock"]
+            self.auditids = set(state["auditids"])
+            logger.info(f"Watching audit log since {time.ctime(self.clock)}")
+        else:
+            self.clock = int(time.time())
+            logger.info("No audit log watermark found, watching for new changes only")
+
+    def save(self) -> None:
+        state_file = Path(config.general.watch.state_file)
+        state_file_tmp = state_file.with_name(f"{state_file.name}.tmp")
+        with Path.open(state_file_tmp, "w") as file:
+            json.dump({"clock": self.clock, "auditids": sorted(self.auditids)}, file)
+        state_file_tmp.replace(state_file)
+
+    def poll(self) -> list[dict]:
+        zapi = zapi_pool.get()
+        entries = zapi.auditlog.get(
+            output=["auditid", "clock", "action", "resourcetype", "resourceid", "resourcename"],
+            filter={"resourcetype": list(_AUDIT_RESOURCE_TYPES) + list(_AUDIT_OWNED_RESOURCE_TYPES)},
+            time_from=self.clock,
+            sortfield="clock",
+            sortorder="ASC",
+        )
+        entries = [entry for entry in entries if entry["auditid"] not in self.auditids]
+
+        for entry in entries:
+            if int(entry["clock"]) > self.clock:
+                self.clock = int(entry["clock"])
+                self.auditids = set()
+            if int(entry["clock"]) == self.clock:
+                self.auditids.add(entry["auditid"])
+
+        return entries
+
+    def resolve_owners(self, resourcetype: str, resource_ids: set) -> set:
+        zapi = zapi_pool.get()
+        owned_type = _AUDIT_OWNED_RESOURCE_TYPES[resourcetype]
+        api_action_obj = getattr(zapi, owned_type["api_method_name"]).get
+
+        owner_ids: set = set()
+        for row in api_action_obj(**owned_type["api_params"], **{owned_type["api_ids_param"]: sorted(resource_ids)}):
+            owner_ids |= auditlog_owner_ids(row)
+        return owner_ids
+
+    def changes(self, entries: list[dict]) -> tuple[dict[str, list[int]], list[ExportObject]]:
+        logger = get_logger()
+        zapi = zapi_pool.get()
+
+        updated: dict[str, set] = {}
+        deleted: dict[tuple[str, str], ExportObject] = {}
+        owned: dict[str, set] = {}
+
+        for entry in entries:
+            if entry["resourcetype"] in _AUDIT_RESOURCE_TYPES:
+                export_type_name = _AUDIT_RESOURCE_TYPES[entry["resourcetype"]]
+                if entry["action"] == _AUDIT_ACTION_DELETE:
+                    updated.get(export_type_name, set()).discard(entry["resourceid"])
+                    deleted[(export_type_name, entry["resourceid"])] = ExportObject.from_export(
+                        export_type_name,
+                        entry["resourceid"],
+                        entry["resourcename"],
+                        deleted=True,
+                    )
+                else:
+                    deleted.pop((export_type_name, entry["resourceid"]), None)
+                    updated.setdefault(export_type_name, set()).add(entry["resourceid"])
+            elif entry["action"] != _AUDIT_ACTION_DELETE:
+                owned.setdefault(entry["resourcetype"], set()).add(entry["resourceid"])
+            else:
+                logger.debug(f"Audit log: ignoring deletion of resource type {entry['resourcetype']} ({entry['resourceid']})")
+
+        owner_ids: set = set()
+        for resourcetype, resource_ids in owned.items():
+            owner_ids |= self.resolve_owners(resourcetype, resource_ids)
+
+        if owner_ids:
+            template_ids = {template["templateid"] for template in zapi.template.get(output=["templateid"], templateids=sorted(owner_ids))}
+            updated.setdefault("templates", set()).update(template_ids)
+            updated.setdefault("hosts", set()).update(owner_ids - template_ids)
+
+        selection = {
+            export_type_name: sorted(int(element_id) for element_id in element_ids)
+            for export_type_name, element_ids in updated.items()
+            if element_ids and config.input_settings[export_type_name].enable
+        }
+        return selection, [exportdata for exportdata in deleted.values() if config.input_settings[exportdata.type].enable]
+
+
+__all__ = ["AuditLogWatcher"]
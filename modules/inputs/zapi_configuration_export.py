@@ -1,130 +1,441 @@
-import concurrent.futures
+import os
+import random
 import re
+import time
+from collections.abc import Callable, Iterator
 
 import zabbix_utils
 
 from modules.config import config
-from modules.helpers import sanitize_string
+from modules.exceptions import ExportObjectMismatchError, ExportSectionNotSplittableError, ExportSplitError
+from modules.inputs.zapi_export_split import split_export
+from modules.journal import run_journal
 from modules.logger import get_logger
-from modules.models import ExportObject, ExportObjectList
+from modules.metrics import metrics
+from modules.models import ExportObject
+from modules.scheduler import ExportScheduler
+from modules.state import backup_state
+from modules.throttle import api_throttle
+from modules.zapi import zapi_pool
+
+_EXPORT_RETRY_BASE_DELAY: float = 1
+_EXPORT_RETRY_MAX_DELAY: float = 30
 
 _AVAIL_EXPORT_TYPES: dict = {
     "images": {
         "api_method_name": "image",
         "api_id_field": "imageid",
+        "api_ids_param": "imageids",
         "api_export_field": "images",
+        "api_match_field": "name",
+        "export_section": "images",
+        "export_match_field": "name",
+        "priority": 0,
+        "api_fingerprint_params": {},
     },
     "hostgroups": {
         "api_method_name": "hostgroup",
         "api_id_field": "groupid",
+        "api_ids_param": "groupids",
         "api_export_field": "host_groups",
+        "api_match_field": "name",
+        "export_section": "host_groups",
+        "export_match_field": "name",
+        "priority": 0,
+        "api_fingerprint_params": {},
     },
     "hosts": {
         "api_method_name": "host",
         "api_id_field": "hostid",
+        "api_ids_param": "hostids",
         "api_export_field": "hosts",
+        "api_match_field": "host",
+        "export_section": "hosts",
+        "export_match_field": "host",
+        "priority": 10,
+        "api_fingerprint_params": {
+            "selectParentTemplates": ["templateid"],
+            "selectMacros": ["macro", "value", "type", "description"],
+            "selectTags": ["tag", "value"],
+            "selectInterfaces": ["type", "main", "useip", "ip", "dns", "port"],
+            "selectItems": "count",
+            "selectTriggers": "count",
+            "selectGraphs": "count",
+            "selectDiscoveries": "count",
+            "selectHttpTests": "count",
+        },
+        "api_fingerprint_groups": "selectHostGroups",
     },
     "maps": {
         "api_method_name": "map",
         "api_id_field": "sysmapid",
+        "api_ids_param": "sysmapids",
         "api_export_field": "maps",
+        "api_match_field": "name",
+        "export_section": "maps",
+        "export_match_field": "name",
+        "priority": 0,
+        "api_fingerprint_params": {
+            "selectSelements": "extend",
+            "selectLinks": "extend",
+            "selectUrls": "extend",
+            "selectShapes": "extend",
+            "selectLines": "extend",
+        },
     },
     "mediatypes": {
         "api_method_name": "mediatype",
         "api_id_field": "mediatypeid",
+        "api_ids_param": "mediatypeids",
         "api_export_field": "mediaTypes",
+        "api_match_field": "name",
+        "export_section": "media_types",
+        "export_match_field": "name",
+        "priority": 0,
+        "api_fingerprint_params": {
+            "selectMessageTemplates": "extend",
+        },
     },
     "templategroups": {
         "api_method_name": "templategroup",
         "api_id_field": "groupid",
+        "api_ids_param": "groupids",
         "api_export_field": "template_groups",
+        "api_match_field": "name",
+        "export_section": "template_groups",
+        "export_match_field": "name",
+        "priority": 0,
+        "api_fingerprint_params": {},
     },
     "templates": {
         "api_method_name": "template",
         "api_id_field": "templateid",
+        "api_ids_param": "templateids",
         "api_export_field": "templates",
+        "api_match_field": "host",
+        "export_section": "templates",
+        "export_match_field": "template",
+        "priority": 20,
+        "api_fingerprint_params": {
+            "selectParentTemplates": ["templateid"],
+            "selectMacros": ["macro", "value", "type", "description"],
+            "selectTags": ["tag", "value"],
+            "selectItems": "count",
+            "selectTriggers": "count",
+            "selectGraphs": "count",
+            "selectDiscoveries": "count",
+            "selectHttpTests": "count",
+            "selectDashboards": "count",
+        },
+        "api_fingerprint_groups": "selectTemplateGroups",
     },
 }
 
 
+def zconfig_export_elements(export_type_name: str, export_type_data: dict, elements: list[dict]) -> str:
+    zapi = zapi_pool.get()
+    try:
+        with api_throttle.slot(export_type_name), metrics.timer("export", export_type_name):
+            return zapi.configuration.export(
+                options={
+                    export_type_data["api_export_field"]: [element[export_type_data["api_id_field"]] for element in elements],
+                },
+                prettyprint=True,
+                format=config.zabbix.export_format,
+            )
+    except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError):
+        metrics.count("export_errors", export_type=export_type_name)
+        raise
+
+
+def zconfig_retry_delay(attempt: int) -> float:
+    return min(_EXPORT_RETRY_MAX_DELAY, _EXPORT_RETRY_BASE_DELAY * 2**attempt) * random.uniform(0.5, 1)  # noqa: S311
+
+
+def zconfig_export_failed(export_type_name: str, export_type_data: dict, element: dict, error: Exception) -> None:
+    logger = get_logger()
+
+    element_id = element[export_type_data["api_id_field"]]
+    logger.error(f"Export of {export_type_name} {element['name']} ({element_id}) failed, keeping the previous backup: {error}")
+    metrics.count("objects_failed", export_type=export_type_name)
+    backup_state.forget(export_type_name, element_id)
+    run_journal.failed(export_type_name, element_id, element["name"], error)
+
+
+def zconfig_export_element(export_type_name: str, export_type_data: dict, element: dict) -> str | None:
+    logger = get_logger()
+
+    attempt = 0
+    while True:
+        try:
+            return zconfig_export_elements(export_type_name, export_type_data, [element])
+        except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+            if attempt >= config.general.export_retries:
+                zconfig_export_failed(export_type_name, export_type_data, element, e)
+                return None
+            metrics.count("export_retries", export_type=export_type_name)
+            delay = zconfig_retry_delay(attempt)
+            logger.debug(f"Export of {export_type_name} {element['name']} failed, retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            attempt += 1
+
+
+def zconfig_split_elements(export_type_data: dict, elements: list[dict], data: str) -> list[str]:
+    documents = split_export(
+        data,
+        config.zabbix.export_format,
+        export_type_data["export_section"],
+        export_type_data["export_match_field"],
+    )
+    requested = [element[export_type_data["api_match_field"]] for element in elements]
+    if sorted(documents) != sorted(requested):
+        raise ExportObjectMismatchError(requested, list(documents))
+
+    return [documents[match_value] for match_value in requested]
+
+
 def zconfig_get_data_worker(
     export_type_name: str,
     export_type_data: dict,
-    element: dict,
+    elements: list[dict],
     element_counter: str,
-) -> ExportObject:
+) -> list[ExportObject]:
     logger = get_logger()
-    logger.debug(f"Exporting {export_type_name} {element_counter}: {element['name']} ({element[export_type_data['api_id_field']]})")
-
-    zapi = zabbix_utils.ZabbixAPI(url=config.zabbix.url, **config.zabbix.auth.model_dump())
-    data = zapi.configuration.export(
-        options={
-            export_type_data["api_export_field"]: [
-                element[export_type_data["api_id_field"]],
-            ],
-        },
-        prettyprint=True,
-        format=config.zabbix.export_format,
-    )
 
-    return ExportObject(
-        type=export_type_name,
-        id=element[export_type_data["api_id_field"]],
-        name=element["name"],
-        name_sanitized=sanitize_string(element["name"]),
-        data=data,
-    )
+    if config.input_settings[export_type_name].batch_size == 1 or zconfig_unsplittable(export_type_name, export_type_data, elements):
+        element = elements[0]
+        logger.debug(f"Exporting {export_type_name} {element_counter}: {element['name']} ({element[export_type_data['api_id_field']]})")
+        data = [zconfig_export_element(export_type_name, export_type_data, element)]
+    else:
+        logger.debug(f"Exporting {export_type_name} {element_counter}: batch of {len(elements)}")
+        try:
+            data = zconfig_split_elements(export_type_data, elements, zconfig_export_elements(export_type_name, export_type_data, elements))
+        except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError, ExportSplitError) as e:
+            logger.warning(f"Batch export of {export_type_name} {element_counter} failed, falling back to single exports: {e}")
+            metrics.count("export_retries", export_type=export_type_name)
+            data = []
+            for element in elements:
+                element_data = zconfig_export_element(export_type_name, export_type_data, element)
+                if element_data is not None:
+                    try:
+                        element_data = zconfig_split_elements(export_type_data, [element], element_data)[0]
+                    except ExportSplitError as e:
+                        logger.debug(f"Keeping unsplit export of {export_type_name} {element['name']}: {e}")
+                        if isinstance(e, ExportSectionNotSplittableError):
+                            backup_state.mark_unsplittable(export_type_name, element[export_type_data["api_id_field"]])
+                data.append(element_data)
+
+    return zconfig_export_objects(export_type_name, export_type_data, elements, data)
+
+
+def zconfig_unsplittable(export_type_name: str, export_type_data: dict, elements: list[dict]) -> bool:
+    return len(elements) == 1 and backup_state.is_unsplittable(export_type_name, elements[0][export_type_data["api_id_field"]])
+
+
+def zconfig_export_objects(
+    export_type_name: str,
+    export_type_data: dict,
+    elements: list[dict],
+    data: list[str | None],
+) -> list[ExportObject]:
+    return [
+        ExportObject.from_export(export_type_name, element[export_type_data["api_id_field"]], element["name"], element_data)
+        for element, element_data in zip(elements, data, strict=True)
+    ]
+
+
+def zconfig_element_output(export_type_data: dict) -> list[str]:
+    return list(dict.fromkeys([export_type_data["api_id_field"], "name", export_type_data["api_match_field"]]))
+
+
+def zconfig_priority(export_type_name: str, export_type_data: dict) -> int:
+    if config.input_settings[export_type_name].priority is None:
+        return export_type_data["priority"]
+    return config.input_settings[export_type_name].priority
+
+
+def zconfig_exclude_patterns(export_type_name: str) -> list[re.Pattern]:
+    excludes = config.input_settings[export_type_name].excludes
+    if not excludes:
+        return []
+    try:
+        return [re.compile("|".join(f"(?:{pattern})" for pattern in excludes))]
+    except re.error:
+        return [re.compile(pattern) for pattern in excludes]
+
+
+def zconfig_element_excluded(exclude_patterns: list[re.Pattern], element: dict) -> bool:
+    return any(pattern.search(element["name"]) for pattern in exclude_patterns)
 
 
-def zconfig_get_data(export_type_name: str, export_type_data: dict) -> ExportObjectList:
-    data: ExportObjectList = []
+def zconfig_element_filter(export_type_name: str) -> dict:
+    return config.input_settings[export_type_name].api_filter
 
-    zapi = zabbix_utils.ZabbixAPI(url=config.zabbix.url, **config.zabbix.auth.model_dump())
+
+def zconfig_page_filter(export_type_data: dict, element_filter: dict) -> dict:
+    return {param: value for param, value in element_filter.items() if param != export_type_data["api_ids_param"]}
+
+
+def zconfig_selected_ids(export_type_data: dict, element_filter: dict, element_ids: list[int]) -> list[int]:
+    filter_ids = element_filter.get(export_type_data["api_ids_param"])
+    if filter_ids is None:
+        return element_ids
+    allowed_ids = {int(element_id) for element_id in (filter_ids if isinstance(filter_ids, list) else [filter_ids])}
+    return [element_id for element_id in element_ids if int(element_id) in allowed_ids]
+
+
+def zconfig_element_params(export_type_data: dict, version: zabbix_utils.APIVersion) -> dict:
+    if not backup_state.enabled:
+        return {"output": zconfig_element_output(export_type_data)}
+
+    params = {"output": "extend", **export_type_data["api_fingerprint_params"]}
+    if "api_fingerprint_groups" in export_type_data:
+        params[export_type_data["api_fingerprint_groups"] if version >= 6.2 else "selectGroups"] = ["groupid"]
+    return params
+
+
+def zconfig_element_prepare(export_type_name: str, export_type_data: dict, element: dict) -> tuple[dict, bool]:
+    unchanged = backup_state.unchanged(export_type_name, element[export_type_data["api_id_field"]], element)
+    return {field: element[field] for field in zconfig_element_output(export_type_data)}, unchanged
+
+
+def zconfig_element_pending(export_type_name: str, export_type_data: dict, element: dict) -> bool:
+    return not run_journal.completed(export_type_name, element[export_type_data["api_id_field"]])
+
+
+def zconfig_enumerate(
+    export_type_name: str,
+    export_type_data: dict,
+    element_ids: list[int] | None = None,
+) -> Iterator[tuple[dict, bool, str]]:
+    logger = get_logger()
+
+    zapi = zapi_pool.get()
 
     api_method_obj = getattr(zapi, export_type_data["api_method_name"])
     api_action_obj = api_method_obj.get
 
-    elements = api_action_obj(
-        output=[export_type_data["api_id_field"], "name"],
-        limit=2,
-    )
+    element_filter = zconfig_element_filter(export_type_name)
+    if element_ids is None:
+        with api_throttle.slot(export_type_name), metrics.timer("enumerate", export_type_name):
+            elements = api_action_obj(**element_filter, output=[export_type_data["api_id_field"]])
+        element_ids = [element[export_type_data["api_id_field"]] for element in elements]
+    else:
+        element_ids = zconfig_selected_ids(export_type_data, element_filter, element_ids)
+    element_ids = sorted(int(element_id) for element_id in element_ids)
+    logger.debug(f"Found {len(element_ids)} {export_type_name}")
 
-    elements_filtered: list = []
-    for element in elements:
-        if not any(re.search(pattern, element["name"]) for pattern in config.inputs.model_dump()[export_type_name]["excludes"]):
-            elements_filtered.append(element)
+    page_size = config.general.page_size
+    page_filter = zconfig_page_filter(export_type_data, element_filter)
+    element_params = zconfig_element_params(export_type_data, zapi.version)
+    exclude_patterns = zconfig_exclude_patterns(export_type_name)
 
     element_counter: int = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=config.general.max_threads) as pool:
-        pool_jobs: list = []
-        for element in elements_filtered:
-            element_counter += 1
-            element_counter_str: str = f"{element_counter}/{len(elements_filtered)}"
-
-            pool_jobs.append(
-                pool.submit(
-                    zconfig_get_data_worker,
-                    export_type_name=export_type_name,
-                    export_type_data=export_type_data,
-                    element=element,
-                    element_counter=element_counter_str,
-                ),
+    for page_start in range(0, len(element_ids), page_size):
+        with api_throttle.slot(export_type_name), metrics.timer("enumerate", export_type_name):
+            elements = api_action_obj(
+                **page_filter,
+                **element_params,
+                **{export_type_data["api_ids_param"]: element_ids[page_start : page_start + page_size]},
             )
 
-        for job in concurrent.futures.as_completed(pool_jobs):
-            data.append(job.result())
+        for element in sorted(elements, key=lambda element: int(element[export_type_data["api_id_field"]])):
+            element_counter += 1
+            if not zconfig_element_excluded(exclude_patterns, element):
+                element_output, unchanged = zconfig_element_prepare(export_type_name, export_type_data, element)
+                if zconfig_element_pending(export_type_name, export_type_data, element_output):
+                    yield element_output, unchanged, f"{element_counter}/{len(element_ids)}"
+
 
-    return data
+def zconfig_batch_counter(counters: list[str]) -> str:
+    if len(counters) == 1:
+        return counters[0]
+    return f"{counters[0].split('/')[0]}-{counters[-1]}"
 
 
-def zconfig_export() -> ExportObjectList:
-    data: ExportObjectList = []
+def zconfig_unchanged_worker(export_type_name: str, export_type_data: dict, elements: list[dict]) -> list[ExportObject]:
+    logger = get_logger()
+    logger.debug(f"Skipping {len(elements)} unchanged {export_type_name}")
+    return zconfig_export_objects(export_type_name, export_type_data, elements, [None] * len(elements))
+
+
+def zconfig_data_job(export_type_name: str, export_type_data: dict, batch: list[dict], batch_counters: list[str]) -> tuple[Callable, dict]:
+    return (
+        zconfig_get_data_worker,
+        {
+            "export_type_name": export_type_name,
+            "export_type_data": export_type_data,
+            "elements": batch,
+            "element_counter": zconfig_batch_counter(batch_counters),
+        },
+    )
+
+
+def zconfig_unchanged_job(export_type_name: str, export_type_data: dict, elements: list[dict]) -> tuple[Callable, dict]:
+    return (
+        zconfig_unchanged_worker,
+        {
+            "export_type_name": export_type_name,
+            "export_type_data": export_type_data,
+            "elements": elements,
+        },
+    )
+
+
+def zconfig_get_jobs(
+    export_type_name: str,
+    export_type_data: dict,
+    element_ids: list[int] | None = None,
+) -> Iterator[tuple[Callable, dict]]:
+    batch_size = config.input_settings[export_type_name].batch_size
+    page_size = config.general.page_size
+
+    batch: list = []
+    batch_counters: list = []
+    unchanged_elements: list = []
+    for element, unchanged, element_counter in zconfig_enumerate(export_type_name, export_type_data, element_ids):
+        if unchanged:
+            unchanged_elements.append(element)
+        elif batch_size > 1 and zconfig_unsplittable(export_type_name, export_type_data, [element]):
+            yield zconfig_data_job(export_type_name, export_type_data, [element], [element_counter])
+        else:
+            batch.append(element)
+            batch_counters.append(element_counter)
+
+        if len(batch) == batch_size:
+            yield zconfig_data_job(export_type_name, export_type_data, batch, batch_counters)
+            batch = []
+            batch_counters = []
+
+        if len(unchanged_elements) == page_size:
+            yield zconfig_unchanged_job(export_type_name, export_type_data, unchanged_elements)
+            unchanged_elements = []
+
+    if batch:
+        yield zconfig_data_job(export_type_name, export_type_data, batch, batch_counters)
+    if unchanged_elements:
+        yield zconfig_unchanged_job(export_type_name, export_type_data, unchanged_elements)
+
+
+def zconfig_export(selection: dict[str, list[int]] | None = None) -> Iterator[ExportObject]:
+    max_threads = config.general.max_threads or min(32, (os.cpu_count() or 1) + 4)
+    api_throttle.setup(max_threads)
+    scheduler = ExportScheduler(max_workers=max_threads, max_pending=max_threads * 2)
 
     for export_type_name, export_type_data in _AVAIL_EXPORT_TYPES.items():
-        if config.inputs.model_dump()[export_type_name]["enable"]:
-            data = data + zconfig_get_data(export_type_name, export_type_data)
+        export_settings = config.input_settings[export_type_name]
+        if selection is not None and export_type_name not in selection:
+            continue
+        if export_settings.enable:
+            scheduler.add_source(
+                export_type_name,
+                zconfig_get_jobs(export_type_name, export_type_data, None if selection is None else selection[export_type_name]),
+                priority=zconfig_priority(export_type_name, export_type_data),
+                max_workers=export_settings.max_threads,
+            )
 
-    return data
+    for data in scheduler.run():
+        yield from data
 
 
 __all__ = ["zconfig_export"]
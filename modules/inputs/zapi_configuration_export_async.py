@@ -0,0 +1,270 @@
+import asyncio
+import queue
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+import aiohttp
+import zabbix_utils
+
+from modules.config import config
+from modules.exceptions import ExportSectionNotSplittableError, ExportSplitError, ExportStreamAbortedError
+from modules.inputs.zapi_configuration_export import (
+    _AVAIL_EXPORT_TYPES,
+    zconfig_batch_counter,
+    zconfig_element_excluded,
+    zconfig_element_filter,
+    zconfig_element_params,
+    zconfig_element_pending,
+    zconfig_element_prepare,
+    zconfig_exclude_patterns,
+    zconfig_export_failed,
+    zconfig_export_objects,
+    zconfig_page_filter,
+    zconfig_priority,
+    zconfig_retry_delay,
+    zconfig_selected_ids,
+    zconfig_split_elements,
+    zconfig_unsplittable,
+)
+from modules.logger import get_logger
+from modules.metrics import metrics
+from modules.models import ExportObject
+from modules.state import backup_state
+
+_EXPORT_END = object()
+
+
+class AsyncExporter:
+    def __init__(self, results: queue.Queue, stop: threading.Event, selection: dict[str, list[int]] | None = None) -> None:
+        self.results = results
+        self.stop = stop
+        self.selection = selection
+        self.zapi: zabbix_utils.AsyncZabbixAPI | None = None
+        self.semaphore = asyncio.Semaphore(config.general.max_async_requests)
+
+    async def put(self, item: list[ExportObject]) -> None:
+        while not self.stop.is_set():
+            try:
+                self.results.put_nowait(item)
+            except queue.Full:
+                await asyncio.sleep(0.05)
+                continue
+            return
+        raise ExportStreamAbortedError
+
+    async def request(self, export_type_name: str, method: str, **params: object) -> Any:  # noqa: ANN401
+        api_object, api_action = method.split(".")
+        queued = time.perf_counter()
+        async with self.semaphore:
+            metrics.observe("queue_wait", time.perf_counter() - queued, export_type_name)
+            with metrics.timer("export" if method == "configuration.export" else "enumerate", export_type_name):
+                return await getattr(getattr(self.zapi, api_object), api_action)(**params)
+
+    async def export_elements(self, export_type_name: str, export_type_data: dict, elements: list[dict]) -> str:
+        try:
+            return await self.request(
+                export_type_name,
+                "configuration.export",
+                options={
+                    export_type_data["api_export_field"]: [element[export_type_data["api_id_field"]] for element in elements],
+                },
+                prettyprint=True,
+                format=config.zabbix.export_format,
+            )
+        except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError):
+            metrics.count("export_errors", export_type=export_type_name)
+            raise
+
+    async def export_element(self, export_type_name: str, export_type_data: dict, element: dict) -> str | None:
+        logger = get_logger()
+
+        attempt = 0
+        while True:
+            try:
+                return await self.export_elements(export_type_name, export_type_data, [element])
+            except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+                if attempt >= config.general.export_retries:
+                    zconfig_export_failed(export_type_name, export_type_data, element, e)
+                    return None
+                metrics.count("export_retries", export_type=export_type_name)
+                delay = zconfig_retry_delay(attempt)
+                logger.debug(f"Export of {export_type_name} {element['name']} failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def get_data_worker(self, export_type_name: str, export_type_data: dict, elements: list[dict], element_counter: str) -> None:
+        logger = get_logger()
+
+        if config.input_settings[export_type_name].batch_size == 1 or zconfig_unsplittable(export_type_name, export_type_data, elements):
+            element = elements[0]
+            logger.debug(f"Exporting {export_type_name} {element_counter}: {element['name']} ({element[export_type_data['api_id_field']]})")
+            data = [await self.export_element(export_type_name, export_type_data, element)]
+        else:
+            logger.debug(f"Exporting {export_type_name} {element_counter}: batch of {len(elements)}")
+            try:
+                batch_data = await self.export_elements(export_type_name, export_type_data, elements)
+                data = zconfig_split_elements(export_type_data, elements, batch_data)
+            except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError, ExportSplitError) as e:
+                logger.warning(f"Batch export of {export_type_name} {element_counter} failed, falling back to single exports: {e}")
+                metrics.count("export_retries", export_type=export_type_name)
+                data = await asyncio.gather(*(self.export_element(export_type_name, export_type_data, element) for element in elements))
+                for index, element in enumerate(elements):
+                    if data[index] is None:
+                        continue
+                    try:
+                        data[index] = zconfig_split_elements(export_type_data, [element], data[index])[0]
+                    except ExportSplitError as e:
+                        logger.debug(f"Keeping unsplit export of {export_type_name} {element['name']}: {e}")
+                        if isinstance(e, ExportSectionNotSplittableError):
+                            backup_state.mark_unsplittable(export_type_name, element[export_type_data["api_id_field"]])
+
+        await self.put(zconfig_export_objects(export_type_name, export_type_data, elements, data))
+
+    async def enumerate(self, export_type_name: str, export_type_data: dict) -> AsyncIterator[tuple[dict, bool, str]]:
+        logger = get_logger()
+        api_method = f"{export_type_data['api_method_name']}.get"
+
+        element_filter = zconfig_element_filter(export_type_name)
+        if self.selection is None:
+            elements = await self.request(export_type_name, api_method, **element_filter, output=[export_type_data["api_id_field"]])
+            element_ids = [element[export_type_data["api_id_field"]] for element in elements]
+        else:
+            element_ids = zconfig_selected_ids(export_type_data, element_filter, self.selection[export_type_name])
+        element_ids = sorted(int(element_id) for element_id in element_ids)
+        logger.debug(f"Found {len(element_ids)} {export_type_name}")
+
+        page_size = config.general.page_size
+        page_filter = zconfig_page_filter(export_type_data, element_filter)
+        element_params = zconfig_element_params(export_type_data, self.zapi.version)
+        exclude_patterns = zconfig_exclude_patterns(export_type_name)
+
+        element_counter: int = 0
+        for page_start in range(0, len(element_ids), page_size):
+            elements = await self.request(
+                export_type_name,
+                api_method,
+                **page_filter,
+                **element_params,
+                **{export_type_data["api_ids_param"]: element_ids[page_start : page_start + page_size]},
+            )
+
+            for element in sorted(elements, key=lambda element: int(element[export_type_data["api_id_field"]])):
+                element_counter += 1
+                if not zconfig_element_excluded(exclude_patterns, element):
+                    element_output, unchanged = zconfig_element_prepare(export_type_name, export_type_data, element)
+                    if zconfig_element_pending(export_type_name, export_type_data, element_output):
+                        yield element_output, unchanged, f"{element_counter}/{len(element_ids)}"
+
+    async def export_type(self, export_type_name: str, export_type_data: dict) -> None:
+        logger = get_logger()
+        export_settings = config.input_settings[export_type_name]
+        max_pending = export_settings.max_threads or config.general.max_async_requests
+        page_size = config.general.page_size
+
+        tasks: set[asyncio.Task] = set()
+
+        async def submit(batch: list[dict], batch_counters: list[str]) -> None:
+            nonlocal tasks
+            if len(tasks) >= max_pending:
+                done_tasks, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done_tasks:
+                    task.result()
+            element_counter = zconfig_batch_counter(batch_counters)
+            tasks.add(asyncio.create_task(self.get_data_worker(export_type_name, export_type_data, batch, element_counter)))
+
+        async def submit_unchanged(elements: list[dict]) -> None:
+            logger.debug(f"Skipping {len(elements)} unchanged {export_type_name}")
+            await self.put(zconfig_export_objects(export_type_name, export_type_data, elements, [None] * len(elements)))
+
+        try:
+            batch: list = []
+            batch_counters: list = []
+            unchanged_elements: list = []
+            async for element, unchanged, element_counter in self.enumerate(export_type_name, export_type_data):
+                if unchanged:
+                    unchanged_elements.append(element)
+                elif export_settings.batch_size > 1 and zconfig_unsplittable(export_type_name, export_type_data, [element]):
+                    await submit([element], [element_counter])
+                else:
+                    batch.append(element)
+                    batch_counters.append(element_counter)
+
+                if len(batch) == export_settings.batch_size:
+                    await submit(batch, batch_counters)
+                    batch = []
+                    batch_counters = []
+
+                if len(unchanged_elements) == page_size:
+                    await submit_unchanged(unchanged_elements)
+                    unchanged_elements = []
+
+            if batch:
+                await submit(batch, batch_counters)
+            if unchanged_elements:
+                await submit_unchanged(unchanged_elements)
+
+            for task in asyncio.as_completed(tasks):
+                await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self) -> None:
+        export_types = sorted(
+            (
+                (export_type_name, export_type_data)
+                for export_type_name, export_type_data in _AVAIL_EXPORT_TYPES.items()
+                if config.input_settings[export_type_name].enable and (self.selection is None or export_type_name in self.selection)
+            ),
+            key=lambda export_type: -zconfig_priority(*export_type),
+        )
+
+        connector = aiohttp.TCPConnector(limit=config.general.max_async_requests)
+        async with aiohttp.ClientSession(connector=connector) as client_session:
+            self.zapi = zabbix_utils.AsyncZabbixAPI(url=config.zabbix.url, client_session=client_session)
+            await self.zapi.login(**config.zabbix.auth.model_dump())
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    for export_type_name, export_type_data in export_types:
+                        task_group.create_task(self.export_type(export_type_name, export_type_data))
+            finally:
+                await self.zapi.logout()
+
+
+def zconfig_export_thread(results: queue.Queue, stop: threading.Event, selection: dict[str, list[int]] | None) -> None:
+    try:
+        asyncio.run(AsyncExporter(results, stop, selection).run())
+    except* ExportStreamAbortedError:
+        pass
+    except* Exception as e:
+        error = e
+        while isinstance(error, BaseExceptionGroup):
+            error = error.exceptions[0]
+        results.put(error)
+    results.put(_EXPORT_END)
+
+
+def zconfig_export(selection: dict[str, list[int]] | None = None) -> Iterator[ExportObject]:
+    results: queue.Queue = queue.Queue(maxsize=config.general.queue_size)
+    stop = threading.Event()
+    thread = threading.Thread(target=zconfig_export_thread, args=(results, stop, selection), name="export-asyncio", daemon=True)
+    thread.start()
+
+    try:
+        while (data := results.get()) is not _EXPORT_END:
+            if isinstance(data, Exception):
+                raise data
+            yield from data
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        thread.join()
+
+
+__all__ = ["zconfig_export"]
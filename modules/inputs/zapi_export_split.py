@@ -0,0 +1,130 @@
+import json
+import xml.etree.ElementTree as ET
+
+import yaml
+
+from modules.exceptions import ExportObjectMismatchError, ExportParseError, ExportSectionMissingError, ExportSectionNotSplittableError
+
+_EXPORT_META_KEYS: set = {"version", "date"}
+_EXPORT_GROUP_SECTIONS: set = {"groups", "host_groups", "template_groups"}
+_EXPORT_REFERENCE_SECTIONS: set = {"images"}
+
+
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+_YAML_WIDTH: int = 2**31 - 1
+
+
+def _dict_group_names(entry: dict) -> set:
+    return {group["name"] for group in entry.get("groups", []) if isinstance(group, dict) and "name" in group}
+
+
+def _dict_reference_names(value: object) -> set:
+    names: set = set()
+    if isinstance(value, dict):
+        if set(value) == {"name"}:
+            names.add(value["name"])
+        for child in value.values():
+            names |= _dict_reference_names(child)
+    elif isinstance(value, list):
+        for child in value:
+            names |= _dict_reference_names(child)
+    return names
+
+
+def _split_dict(export: dict, section: str, match_field: str) -> dict[str, dict]:
+    if section not in export:
+        raise ExportSectionMissingError(section)
+
+    for key in export:
+        if key not in {section} | _EXPORT_META_KEYS | _EXPORT_GROUP_SECTIONS | _EXPORT_REFERENCE_SECTIONS:
+            raise ExportSectionNotSplittableError(key)
+
+    documents: dict[str, dict] = {}
+    for entry in export[section]:
+        if entry.get(match_field) in documents:
+            raise ExportObjectMismatchError([], [entry.get(match_field)])
+
+        document: dict = {}
+        for key, value in export.items():
+            if key == section:
+                document[key] = [entry]
+            elif key in _EXPORT_META_KEYS:
+                document[key] = value
+            else:
+                names = _dict_group_names(entry) if key in _EXPORT_GROUP_SECTIONS else _dict_reference_names(entry)
+                references = [reference for reference in value if reference.get("name") in names]
+                if references:
+                    document[key] = references
+        documents[entry.get(match_field)] = document
+
+    return documents
+
+
+def _xml_group_names(entry: ET.Element) -> set:
+    return {group.findtext("name") for group in entry.findall("groups/group")}
+
+
+def _xml_reference_names(entry: ET.Element) -> set:
+    return {element.findtext("name") for element in entry.iter() if [child.tag for child in element] == ["name"]}
+
+
+def _split_xml(content: str, section: str, match_field: str) -> dict[str, str]:
+    root = ET.fromstring(content)  # noqa: S314
+    tags = [child.tag for child in root]
+    if section not in tags:
+        raise ExportSectionMissingError(section)
+
+    for tag in tags:
+        if tag not in {section} | _EXPORT_META_KEYS | _EXPORT_GROUP_SECTIONS | _EXPORT_REFERENCE_SECTIONS:
+            raise ExportSectionNotSplittableError(tag)
+
+    documents: dict[str, str] = {}
+    for entry in root.find(section):
+        match_value = entry.findtext(match_field)
+        if match_value in documents:
+            raise ExportObjectMismatchError([], [match_value])
+
+        document = ET.Element(root.tag, root.attrib)
+        for child in root:
+            if child.tag == section:
+                container = ET.SubElement(document, child.tag, child.attrib)
+                container.append(entry)
+            elif child.tag in _EXPORT_META_KEYS:
+                document.append(child)
+            else:
+                names = _xml_group_names(entry) if child.tag in _EXPORT_GROUP_SECTIONS else _xml_reference_names(entry)
+                references = [reference for reference in child if reference.findtext("name") in names]
+                if references:
+                    container = ET.SubElement(document, child.tag, child.attrib)
+                    container.extend(references)
+        documents[match_value] = serialize_xml(document)
+
+    return documents
+
+
+def serialize_xml(document: ET.Element) -> str:
+    ET.indent(document, space="    ")
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(document, encoding="unicode") + "\n"
+
+
+def serialize_dict(document: dict, export_format: str) -> str:
+    if export_format == "json":
+        return json.dumps(document, indent=4, ensure_ascii=False)
+    return yaml.dump(document, Dumper=_YamlDumper, sort_keys=False, allow_unicode=True, width=_YAML_WIDTH)
+
+
+def split_export(content: str, export_format: str, section: str, match_field: str) -> dict[str, str]:
+    try:
+        if export_format == "xml":
+            return _split_xml(content, section, match_field)
+
+        export = json.loads(content) if export_format == "json" else yaml.load(content, Loader=_YamlLoader)  # noqa: S506
+        export = export["zabbix_export"]
+
+        return {
+            match_value: serialize_dict({"zabbix_export": document}, export_format)
+            for match_value, document in _split_dict(export, section, match_field).items()
+        }
+    except (ET.ParseError, json.JSONDecodeError, yaml.YAMLError, KeyError, TypeError, AttributeError) as e:
+        raise ExportParseError(e) from e
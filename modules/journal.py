@@ -0,0 +1,217 @@
+import contextlib
+import datetime as dt
+import json
+import os
+import shutil
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import TextIO
+
+from modules.config import config
+from modules.logger import get_logger
+from modules.metrics import metrics
+from modules.models import ExportObject
+
+_JOURNAL_FILE: str = "journal.jsonl"
+_JOURNAL_SPOOL_DIR: str = "spool"
+
+
+class RunJournal:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.file: TextIO | None = None
+        self.reset()
+
+    @property
+    def enabled(self) -> bool:
+        return config.general.journal.enable and not config.general.dryrun
+
+    @property
+    def path(self) -> Path:
+        return Path(config.general.journal.path)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started: float = time.time()
+            self.export_format: str | None = None
+            self.objects: dict[tuple[str, str], dict] = {}
+            self.failures: dict[tuple[str, str], dict] = {}
+            self.committed: set[str] = set()
+            self.finished: bool = False
+            self.partial: bool = False
+            self.resumed: bool = False
+
+    def load(self) -> bool:
+        logger = get_logger()
+
+        journal_file = self.path / _JOURNAL_FILE
+        if not journal_file.exists():
+            return False
+
+        with Path.open(journal_file, "r") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.debug(f"Journal: Ignoring truncated entry in {journal_file}")
+                    continue
+                self.apply(event)
+        return True
+
+    def apply(self, event: dict) -> None:
+        key = (event.get("type"), event.get("id"))
+        match event["event"]:
+            case "start":
+                self.started = event["time"]
+                self.export_format = event["export_format"]
+            case "object":
+                self.objects[key] = {"name": event["name"], "replay": True}
+                self.failures.pop(key, None)
+            case "failed":
+                self.failures[key] = {"name": event["name"], "error": event["error"]}
+            case "output":
+                self.committed.add(event["name"])
+            case "finish":
+                for entry in self.objects.values():
+                    entry["replay"] = False
+                self.committed.clear()
+                self.finished = True
+            case "resume":
+                self.finished = False
+                self.partial = event["partial"]
+
+    def start(self, *, resume: bool) -> None:
+        logger = get_logger()
+        self.reset()
+
+        if not self.enabled:
+            return
+
+        if resume and self.load() and self.export_format == config.zabbix.export_format:
+            self.resumed = True
+            self.partial = self.partial or self.finished
+            replay = sum(entry["replay"] for entry in self.objects.values())
+            logger.info(
+                f"Journal: Resuming run from {dt.datetime.fromtimestamp(self.started).astimezone().isoformat(timespec='seconds')}, "
+                f"{len(self.objects)} objects done ({replay} spooled), {len(self.failures)} failed, "
+                f"outputs done: {', '.join(sorted(self.committed)) or '-'}",
+            )
+            self.open()
+            self.write({"event": "resume", "time": time.time(), "partial": self.partial})
+            self.finished = False
+            self.failures.clear()
+            return
+
+        if resume:
+            logger.warning(f"Journal: No resumable run with export format {config.zabbix.export_format} in {self.path}, starting a new run")
+        elif (self.path / _JOURNAL_FILE).exists():
+            logger.warning(f"Journal: Discarding the journal of an unfinished run in {self.path}, use --resume to continue it")
+        self.reset()
+        self.remove()
+        self.open()
+        self.write({"event": "start", "time": self.started, "export_format": config.zabbix.export_format})
+
+    def remove(self) -> None:
+        (self.path / _JOURNAL_FILE).unlink(missing_ok=True)
+        shutil.rmtree(self.path / _JOURNAL_SPOOL_DIR, ignore_errors=True)
+        with contextlib.suppress(OSError):
+            self.path.rmdir()
+
+    def open(self) -> None:
+        Path.mkdir(self.path / _JOURNAL_SPOOL_DIR, mode=0o700, parents=True, exist_ok=True)
+        self.file = Path.open(self.path / _JOURNAL_FILE, "a")
+
+    def write(self, event: dict) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.write(json.dumps(event) + "\n")
+                self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def interrupt(self) -> None:
+        logger = get_logger()
+
+        if self.file is not None:
+            self.close()
+            logger.info(f"Journal: Run interrupted, use --resume to continue it from {self.path}")
+
+    def spool_path(self, export_type: str, element_id: str) -> Path:
+        return self.path / _JOURNAL_SPOOL_DIR / export_type / element_id
+
+    def completed(self, export_type: str, element_id: str | int) -> bool:
+        return (export_type, str(element_id)) in self.objects
+
+    def failed(self, export_type: str, element_id: str | int, name: str, error: Exception) -> None:
+        with self.lock:
+            self.failures[(export_type, str(element_id))] = {"name": name, "error": str(error)}
+        self.write({"event": "failed", "type": export_type, "id": str(element_id), "name": name, "error": str(error)})
+
+    def record(self, source: Iterable[ExportObject]) -> Iterator[ExportObject]:
+        for exportdata in source:
+            if self.file is not None and exportdata.data is not None and not exportdata.deleted:
+                spool_path = self.spool_path(exportdata.type, str(exportdata.id))
+                Path.mkdir(spool_path.parent, mode=0o700, exist_ok=True)
+                spool_path_tmp = spool_path.with_name(f".{spool_path.name}.tmp")
+                with os.fdopen(os.open(spool_path_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as file:
+                    file.write(exportdata.data)
+                spool_path_tmp.replace(spool_path)
+                self.objects[(exportdata.type.value, str(exportdata.id))] = {"name": exportdata.name, "replay": True}
+                self.write({"event": "object", "type": exportdata.type.value, "id": str(exportdata.id), "name": exportdata.name})
+            yield exportdata
+
+    def replay(self) -> Iterator[ExportObject]:
+        logger = get_logger()
+
+        for (export_type, element_id), entry in list(self.objects.items()):
+            if not entry["replay"]:
+                continue
+            exportdata = ExportObject.from_export(export_type, element_id, entry["name"])
+            try:
+                exportdata.data = self.spool_path(export_type, element_id).read_bytes()
+            except FileNotFoundError:
+                logger.warning(f"Journal: Spooled export of {export_type} {entry['name']} ({element_id}) is missing, exporting it again")
+                del self.objects[(export_type, element_id)]
+                continue
+            metrics.count("objects_resumed", export_type=export_type)
+            yield exportdata
+
+    def outputs(self, sinks: dict[str, Callable]) -> dict[str, Callable]:
+        logger = get_logger()
+
+        for name in sinks:
+            if name in self.committed:
+                logger.debug(f"Output - {name}: already finished before the run was interrupted, skipping")
+
+        def commit(name: str, sink: Callable) -> Callable:
+            def journal_sink(data: Iterable[ExportObject]) -> None:
+                sink(data, complete=not self.partial)
+                self.write({"event": "output", "name": name})
+
+            return journal_sink
+
+        return {name: commit(name, sink) for name, sink in sinks.items() if name not in self.committed}
+
+    def finish(self) -> None:
+        logger = get_logger()
+
+        if self.file is None:
+            return
+        if self.failures:
+            self.write({"event": "finish", "time": time.time()})
+            self.close()
+            shutil.rmtree(self.path / _JOURNAL_SPOOL_DIR, ignore_errors=True)
+            logger.info(f"Journal: {len(self.failures)} failed objects kept in {self.path}, use --resume to retry them")
+        else:
+            self.close()
+            self.remove()
+            logger.debug(f"Journal: Run finished, journal in {self.path} removed")
+
+
+run_journal = RunJournal()
@@ -0,0 +1,228 @@
+import bisect
+import contextlib
+import datetime as dt
+import json
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import zabbix_utils
+
+from modules.config import config
+from modules.logger import get_logger
+
+_METRICS_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+_METRICS_QUANTILES: dict[str, float] = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+_METRICS_ALL: str = "all"
+_METRICS_PREFIX: str = "zabbup"
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.buckets: list[int] = [0] * (len(_METRICS_BUCKETS) + 1)
+        self.count: int = 0
+        self.sum: float = 0
+        self.max: float = 0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(_METRICS_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, quantile: float) -> float:
+        rank = quantile * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = _METRICS_BUCKETS[index - 1] if index else 0
+                upper = _METRICS_BUCKETS[index] if index < len(_METRICS_BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return self.max
+
+    def cumulative(self) -> Iterator[tuple[str, int]]:
+        cumulative = 0
+        for bound, bucket_count in zip((*_METRICS_BUCKETS, "+Inf"), self.buckets, strict=True):
+            cumulative += bucket_count
+            yield str(bound), cumulative
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0,
+            "max": self.max,
+            **{name: self.quantile(quantile) for name, quantile in _METRICS_QUANTILES.items()},
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class RunMetrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.time()
+            self.histograms: dict[tuple[str, str], Histogram] = {}
+            self.counters: dict[tuple[str, str], float] = {}
+            self.gauges: dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float, export_type: str | None = None) -> None:
+        key = (stage, export_type or _METRICS_ALL)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value: float = 1, export_type: str | None = None) -> None:
+        key = (name, export_type or _METRICS_ALL)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, export_type: str | None = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, export_type)
+
+    def total(self, name: str) -> float:
+        return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def total_suffix(self, suffix: str) -> float:
+        return sum(value for (counter_name, _), value in self.counters.items() if counter_name.endswith(f"_{suffix}"))
+
+    def summary(self, *, success: bool) -> dict:
+        with self.lock:
+            duration = time.time() - self.started
+            stages: dict = {}
+            for (stage, export_type), histogram in sorted(self.histograms.items()):
+                stages.setdefault(stage, {})[export_type] = histogram.summary()
+            counters: dict = {}
+            for (name, export_type), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[export_type] = value
+
+            return {
+                "started": dt.datetime.fromtimestamp(self.started, tz=dt.UTC).isoformat(timespec="seconds"),
+                "duration": duration,
+                "success": success,
+                "totals": {
+                    "objects": self.total("objects"),
+                    "bytes": self.total("bytes"),
+                    "objects_per_second": self.total("objects") / duration if duration else 0,
+                    "errors": self.total_suffix("errors"),
+                    "retries": self.total_suffix("retries"),
+                },
+                "stages": stages,
+                "counters": counters,
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def prometheus(self, summary: dict) -> str:
+        lines = [
+            f"# HELP {_METRICS_PREFIX}_stage_duration_seconds Duration of the backup stages per export type",
+            f"# TYPE {_METRICS_PREFIX}_stage_duration_seconds histogram",
+        ]
+        for stage, export_types in summary["stages"].items():
+            for export_type, histogram in export_types.items():
+                labels = f'stage="{stage}",type="{export_type}"'
+                lines.extend(
+                    f'{_METRICS_PREFIX}_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}'
+                    for bound, bucket_count in histogram["buckets"].items()
+                )
+                lines.append(f"{_METRICS_PREFIX}_stage_duration_seconds_sum{{{labels}}} {histogram['sum']}")
+                lines.append(f"{_METRICS_PREFIX}_stage_duration_seconds_count{{{labels}}} {histogram['count']}")
+
+        for name, export_types in summary["counters"].items():
+            lines.append(f"# TYPE {_METRICS_PREFIX}_{name}_total counter")
+            lines.extend(f'{_METRICS_PREFIX}_{name}_total{{type="{export_type}"}} {value}' for export_type, value in export_types.items())
+
+        for name, value in summary["gauges"].items():
+            lines.append(f"# TYPE {_METRICS_PREFIX}_{name} gauge")
+            lines.append(f"{_METRICS_PREFIX}_{name} {value}")
+
+        last_run = {"timestamp_seconds": self.started, "duration_seconds": summary["duration"], "success": int(summary["success"])}
+        for name, value in last_run.items():
+            lines.append(f"# TYPE {_METRICS_PREFIX}_last_run_{name} gauge")
+            lines.append(f"{_METRICS_PREFIX}_last_run_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = RunMetrics()
+
+
+def metrics_write_file(path: Path, content: str) -> None:
+    Path.mkdir(path.parent, parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    temp_path.write_text(content)
+    temp_path.replace(path)
+
+
+def metrics_trapper_items(summary: dict) -> list[zabbix_utils.ItemValue]:
+    host = config.general.metrics.trapper.host
+    values = {
+        f"{_METRICS_PREFIX}.run.success": int(summary["success"]),
+        f"{_METRICS_PREFIX}.run.duration": round(summary["duration"], 3),
+        **{f"{_METRICS_PREFIX}.run.{name}": round(value, 3) for name, value in summary["totals"].items()},
+        **{f"{_METRICS_PREFIX}.run.{name}": value for name, value in summary["gauges"].items()},
+        **{
+            f"{_METRICS_PREFIX}.stage.duration[{stage}]": round(sum(histogram["sum"] for histogram in export_types.values()), 3)
+            for stage, export_types in summary["stages"].items()
+        },
+    }
+    return [zabbix_utils.ItemValue(host, key, str(value)) for key, value in values.items()]
+
+
+def metrics_send_trapper(summary: dict) -> None:
+    logger = get_logger()
+
+    trapper_config = config.general.metrics.trapper
+    sender = zabbix_utils.Sender(server=trapper_config.server, port=trapper_config.port)
+    response = sender.send(metrics_trapper_items(summary))
+    if response.failed:
+        logger.warning(f"Metrics: {response.failed} of {response.total} trapper values rejected by {trapper_config.server}")
+    else:
+        logger.debug(f"Metrics: {response.processed} trapper values sent to {trapper_config.server}")
+
+
+def metrics_report(*, success: bool) -> dict:
+    logger = get_logger()
+
+    summary = metrics.summary(success=success)
+    totals = summary["totals"]
+    logger.info(
+        f"Metrics: {totals['objects']:.0f} objects, {totals['bytes']:.0f} bytes in {summary['duration']:.1f}s "
+        f"({totals['objects_per_second']:.1f}/s), {totals['errors']:.0f} errors, {totals['retries']:.0f} retries",
+    )
+    for stage, export_types in summary["stages"].items():
+        for export_type, histogram in export_types.items():
+            logger.debug(
+                f"Metrics: {stage} {export_type}: {histogram['count']} x {histogram['mean'] * 1000:.1f}ms "
+                f"(p95 {histogram['p95'] * 1000:.1f}ms, max {histogram['max'] * 1000:.1f}ms)",
+            )
+
+    metrics_config = config.general.metrics
+    try:
+        if metrics_config.json_file:
+            metrics_write_file(Path(metrics_config.json_file), json.dumps(summary, indent=2))
+        if metrics_config.textfile:
+            metrics_write_file(Path(metrics_config.textfile), metrics.prometheus(summary))
+    except OSError as e:
+        logger.warning(f"Metrics: Writing the run report failed: {e}")
+
+    if metrics_config.trapper.enable:
+        try:
+            metrics_send_trapper(summary)
+        except (zabbix_utils.exceptions.ProcessingError, OSError) as e:
+            logger.warning(f"Metrics: Sending trapper values failed: {e}")
+    return summary
@@ -1,30 +1,82 @@
-from pydantic import BaseModel, field_validator
+import dataclasses
+import enum
+import queue
+import threading
+from collections.abc import Iterator
+from typing import Self
 
-from modules.exceptions import NotAllowedValueError
+from modules.exceptions import ExportStreamAbortedError, NotAllowedValueError
+from modules.helpers import sanitize_string
 
 
-class ExportObject(BaseModel):
-    type: str
+class ExportType(enum.StrEnum):
+    TEMPLATES = "templates"
+    TEMPLATEGROUPS = "templategroups"
+    HOSTS = "hosts"
+    HOSTGROUPS = "hostgroups"
+    MAPS = "maps"
+    IMAGES = "images"
+    MEDIATYPES = "mediatypes"
+
+
+@dataclasses.dataclass(slots=True)
+class ExportObject:
+    type: ExportType
     id: int
     name: str
     name_sanitized: str
-    data: str
-
-    @field_validator("type")
-    def check_type(cls, value: str) -> str:
-        allowed_formats = [
-            "templates",
-            "templategroups",
-            "hosts",
-            "hostgroups",
-            "maps",
-            "images",
-            "mediatypes",
-        ]
-        if value not in allowed_formats:
-            raise NotAllowedValueError(value, allowed_formats)
-        return value
-
-
-class ExportObjectList(BaseModel):
-    data: list[ExportObject]
+    data: bytes | None = None
+    payload: bytes | None = None
+    encrypted: bool = False
+    deleted: bool = False
+
+    @classmethod
+    def from_export(cls, type_name: str, element_id: str | int, name: str, data: str | None = None, *, deleted: bool = False) -> Self:
+        try:
+            export_type = ExportType(type_name)
+        except ValueError:
+            raise NotAllowedValueError(type_name, [export_type.value for export_type in ExportType]) from None
+        return cls(
+            type=export_type,
+            id=int(element_id),
+            name=name,
+            name_sanitized=sanitize_string(name),
+            data=None if data is None else data.encode(),
+            deleted=deleted,
+        )
+
+
+_STREAM_END = object()
+_STREAM_ABORT = object()
+
+
+class ExportObjectStream:
+    def __init__(self, maxsize: int) -> None:
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.detached = threading.Event()
+
+    def put(self, item: ExportObject | object) -> None:
+        while not self.detached.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return
+
+    def close(self) -> None:
+        self.put(_STREAM_END)
+
+    def abort(self) -> None:
+        self.put(_STREAM_ABORT)
+
+    def detach(self) -> None:
+        self.detached.set()
+
+    def __iter__(self) -> Iterator[ExportObject]:
+        while True:
+            item = self.queue.get()
+            if item is _STREAM_END:
+                return
+            if item is _STREAM_ABORT:
+                raise ExportStreamAbortedError
+            yield item
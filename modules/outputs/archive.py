@@ -0,0 +1,262 @@
+import datetime as dt
+import io
+import json
+import os
+import threading
+import zipfile
+from collections.abc import Iterable
+from pathlib import Path
+from typing import BinaryIO
+
+from minio import Minio
+from minio.commonconfig import GOVERNANCE
+from minio.error import S3Error
+from minio.retention import Retention
+
+from modules.config import config
+from modules.crypto import (
+    CONTAINER_CHUNK_SIZE,
+    CONTAINER_HEADER,
+    CONTAINER_SEGMENT,
+    CONTAINER_TAG_SIZE,
+    ContainerWriter,
+    decrypt_container,
+    encrypt_container,
+    is_encrypted,
+)
+from modules.exceptions import ExportStreamAbortedError
+from modules.logger import get_logger
+from modules.models import ExportObject
+from modules.outputs.s3 import s3_client_create
+from modules.state import backup_state
+
+
+class ArchiveStreamReader:
+    def __init__(self, raw: BinaryIO, aborted: threading.Event) -> None:
+        self.raw = raw
+        self.aborted = aborted
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        if not chunk and self.aborted.is_set():
+            raise ExportStreamAbortedError
+        return chunk
+
+
+def archive_name() -> str:
+    return f"zabbup-{dt.datetime.now(tz=dt.UTC):%Y%m%dT%H%M%SZ}.zip"
+
+
+def archive_index_data(index: dict) -> bytes:
+    index_data = json.dumps(index).encode()
+    if config.outputs.archive.encryption:
+        return encrypt_container(index_data, config.general.encryption_key, compress=True)
+    return index_data
+
+
+def archive_index_load(index_data: bytes) -> dict:
+    if is_encrypted(index_data):
+        index_data = decrypt_container(index_data, config.general.encryption_key)
+    return json.loads(index_data)
+
+
+def archive_local_previous(archive_dir: Path) -> dict | None:
+    if not backup_state.enabled:
+        return None
+    index_paths = sorted(archive_dir.glob("zabbup-*.zip.index.json"))
+    if not index_paths:
+        return None
+    return archive_index_load(index_paths[-1].read_bytes())
+
+
+def archive_s3_previous(s3_client: Minio) -> dict | None:
+    if not backup_state.enabled:
+        return None
+    index_keys = sorted(
+        s3_object.object_name
+        for s3_object in s3_client.list_objects(config.outputs.s3.bucket, prefix=str(Path(config.outputs.archive.path) / "zabbup-"))
+        if s3_object.object_name.endswith(".zip.index.json")
+    )
+    if not index_keys:
+        return None
+    try:
+        response = s3_client.get_object(config.outputs.s3.bucket, index_keys[-1])
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        return None
+    try:
+        return archive_index_load(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def archive_bases(previous: dict | None) -> dict[tuple[str, str], str | None]:
+    if previous is None:
+        return {}
+    bases: dict[tuple[str, str], str | None] = {}
+    for previous_object in previous["objects"]:
+        base = previous_object.get("archive") if previous_object.get("unchanged") else previous["archive"]
+        bases[(previous_object["type"], previous_object["id"])] = base
+    return bases
+
+
+def archive_write(data: Iterable[ExportObject], archive_file: BinaryIO, name: str, *, complete: bool, previous: dict | None = None) -> dict:
+    index_objects: list = []
+    unchanged_objects: int = 0
+    base_archives = archive_bases(previous)
+    encryption = config.outputs.archive.encryption
+    archive_target = ContainerWriter(archive_file, config.general.encryption_key) if encryption else archive_file
+    with zipfile.ZipFile(
+        archive_target,
+        "w",
+        compression=zipfile.ZIP_DEFLATED,
+        compresslevel=config.outputs.archive.compresslevel,
+    ) as archive:
+        for exportdata in data:
+            if exportdata.deleted:
+                continue
+
+            export_path = f"{exportdata.type}/{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}"
+            index_object = {"type": exportdata.type, "id": str(exportdata.id), "name": exportdata.name, "path": export_path}
+            if exportdata.data is None:
+                index_object["unchanged"] = True
+                base_archive = base_archives.get((exportdata.type, str(exportdata.id)))
+                if base_archive is not None:
+                    index_object["archive"] = base_archive
+                unchanged_objects += 1
+            else:
+                archive.writestr(export_path, exportdata.data if encryption else exportdata.payload)
+                index_object["offset"] = archive.infolist()[-1].header_offset
+                index_object["length"] = archive.fp.tell() - index_object["offset"]
+                index_object["encrypted"] = exportdata.encrypted and not encryption
+            index_objects.append(index_object)
+        archive_size = archive.fp.tell()
+
+    index = {
+        "archive": name,
+        "format": "zip",
+        "export_format": config.zabbix.export_format,
+        "created": dt.datetime.now(tz=dt.UTC).isoformat(),
+        "complete": complete and not unchanged_objects,
+        "objects": index_objects,
+    }
+    if unchanged_objects and previous is not None:
+        index["base"] = previous["archive"]
+    if encryption:
+        archive_target.close()
+        index["encryption"] = {
+            "format": "aesgcm",
+            "chunk_size": CONTAINER_CHUNK_SIZE,
+            "header_size": CONTAINER_HEADER.size,
+            "segment_size": CONTAINER_SEGMENT.size + CONTAINER_CHUNK_SIZE + CONTAINER_TAG_SIZE,
+            "plaintext_size": archive_size,
+        }
+    return index
+
+
+def archive_local(data: Iterable[ExportObject], *, complete: bool) -> None:
+    logger = get_logger()
+
+    archive_dir = Path(config.outputs.archive.path)
+    Path.mkdir(archive_dir, parents=True, exist_ok=True)
+    name = archive_name()
+    archive_path = archive_dir / name
+    archive_path_tmp = archive_dir / f"{name}.tmp"
+
+    try:
+        with Path.open(archive_path_tmp, "wb") as archive_file:
+            index = archive_write(data, archive_file, name, complete=complete, previous=archive_local_previous(archive_dir))
+    except BaseException:
+        archive_path_tmp.unlink(missing_ok=True)
+        raise
+    archive_path_tmp.replace(archive_path)
+
+    index_path = archive_dir / f"{name}.index.json"
+    index_path_tmp = archive_dir / f"{name}.index.json.tmp"
+    with Path.open(index_path_tmp, "wb") as index_file:
+        index_file.write(archive_index_data(index))
+    index_path_tmp.replace(index_path)
+
+    logger.info(f"Archive: {len(index['objects'])} objects written to {archive_path}")
+
+
+def archive_s3(data: Iterable[ExportObject], *, complete: bool) -> None:
+    logger = get_logger()
+
+    s3_client = s3_client_create()
+    previous = archive_s3_previous(s3_client)
+    name = archive_name()
+    archive_key = str(Path(config.outputs.archive.path) / name)
+    s3_retention_rule = Retention(
+        GOVERNANCE,
+        dt.datetime.now(tz=dt.UTC) + dt.timedelta(days=config.outputs.s3.retention.days),
+    )
+
+    aborted = threading.Event()
+    upload_errors: list = []
+    read_fd, write_fd = os.pipe()
+
+    def upload() -> None:
+        reader = ArchiveStreamReader(os.fdopen(read_fd, "rb"), aborted)
+        try:
+            s3_client.put_object(
+                bucket_name=config.outputs.s3.bucket,
+                object_name=archive_key,
+                data=reader,
+                length=-1,
+                part_size=config.outputs.archive.part_size,
+                content_type="application/zip",
+                retention=s3_retention_rule,
+            )
+        except Exception as e:
+            upload_errors.append(e)
+        finally:
+            reader.raw.close()
+
+    upload_thread = threading.Thread(target=upload, name="archive-upload", daemon=True)
+    upload_thread.start()
+    try:
+        with os.fdopen(write_fd, "wb") as archive_file:
+            try:
+                index = archive_write(data, archive_file, name, complete=complete, previous=previous)
+            except BaseException:
+                aborted.set()
+                raise
+    except BrokenPipeError:
+        upload_thread.join()
+        if not upload_errors:
+            raise
+    finally:
+        upload_thread.join()
+    if upload_errors:
+        raise upload_errors[0]
+
+    index_data = archive_index_data(index)
+    s3_client.put_object(
+        bucket_name=config.outputs.s3.bucket,
+        object_name=f"{archive_key}.index.json",
+        data=io.BytesIO(index_data),
+        length=len(index_data),
+        content_type="application/octet-stream" if config.outputs.archive.encryption else "application/json",
+        retention=s3_retention_rule,
+    )
+
+    logger.info(f"Archive: {len(index['objects'])} objects uploaded to S3[{config.outputs.s3.bucket}] {archive_key}")
+
+
+def export_archive(data: Iterable[ExportObject], *, complete: bool = True) -> None:
+    logger = get_logger()
+
+    if config.outputs.archive.enable:
+        if config.general.dryrun:
+            logger.info("Dryrun enabled, skipping archive export")
+        elif config.outputs.archive.storage == "s3":
+            logger.info("Writing archive to S3")
+            archive_s3(data, complete=complete)
+        else:
+            logger.info("Writing archive to local disk")
+            archive_local(data, complete=complete)
+    else:
+        logger.debug("Archive output disabled")
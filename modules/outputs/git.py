@@ -1,15 +1,230 @@
+import contextlib
+import hashlib
+import re
+import shutil
+import subprocess
 import tempfile
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 import git
 
+from modules.catalog import Catalog, CatalogRun, catalog_run_id
 from modules.config import config
-from modules.crypto import encrypt
 from modules.logger import get_logger
-from modules.models import ExportObjectList
+from modules.metrics import metrics
+from modules.models import ExportObject
 
+_GIT_PATHS_PER_CALL: int = 1000
+_GIT_OBJECT_PATH = re.compile(r"^(?P<type>[^/]+)/(?P<name>[^/]*)_(?P<id>\d+)\.[^/.]+$")
 
-def export_git(data: ExportObjectList) -> None:
+
+def git_tree_objects(tree_paths: Iterable[str]) -> dict[tuple[str, str], list[str]]:
+    tree_objects: dict = {}
+    for path in tree_paths:
+        if match := _GIT_OBJECT_PATH.match(path):
+            tree_objects.setdefault((match.group("type"), match.group("id")), []).append(path)
+    return tree_objects
+
+
+def git_tree_hashes(repo: git.Repo) -> dict[str, str]:
+    tree_hashes: dict = {}
+    if not repo.head.is_valid():
+        return tree_hashes
+    for entry in repo.git.ls_tree("-r", "-z", "--full-tree", "HEAD").split("\0"):
+        if entry:
+            info, path = entry.split("\t", 1)
+            _, object_type, object_hash = info.split(" ")
+            if object_type == "blob":
+                tree_hashes[path] = object_hash
+    return tree_hashes
+
+
+def git_blob_hash(content: bytes, object_format: str) -> str:
+    blob_hash = hashlib.new(object_format, b"blob %d\0" % len(content))
+    blob_hash.update(content)
+    return blob_hash.hexdigest()
+
+
+def git_clone(workdir: str) -> git.Repo:
+    if config.outputs.git.mode == "plumbing":
+        return git.Repo.clone_from(config.outputs.git.repo, workdir, depth=1, no_checkout=True)
+    return git.Repo.clone_from(config.outputs.git.repo, workdir, depth=1, sparse=True)
+
+
+def git_update_cache(cache_dir: str) -> git.Repo:
+    repo = git.Repo(cache_dir)
+    if repo.remotes.origin.url != config.outputs.git.repo:
+        raise git.InvalidGitRepositoryError(cache_dir)
+
+    branch = repo.active_branch.name
+    repo.git.fetch("--depth=1", "--prune", "origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}")
+    remote_ref = f"origin/{branch}"
+    remote_exists = remote_ref in [ref.name for ref in repo.remotes.origin.refs]
+    if config.outputs.git.mode == "plumbing":
+        if remote_exists:
+            repo.git.reset("--soft", remote_ref)
+        return repo
+
+    if remote_exists:
+        repo.git.reset("--hard", remote_ref)
+    repo.git.sparse_checkout("reapply")
+    repo.git.clean("-fdxq")
+    return repo
+
+
+@contextlib.contextmanager
+def git_working_copy() -> Iterator[git.Repo]:
+    logger = get_logger()
+    cache_dir = config.outputs.git.cache_dir
+
+    if cache_dir is None:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            yield git_clone(tmpdirname)
+        return
+
+    if Path(cache_dir).exists():
+        try:
+            repo = git_update_cache(cache_dir)
+            logger.debug(f"Updated git cache in {cache_dir}")
+        except (git.GitError, ValueError, TypeError) as e:
+            logger.warning(f"Git cache in {cache_dir} is unusable, cloning again: {e!r}")
+            shutil.rmtree(cache_dir)
+            repo = git_clone(cache_dir)
+    else:
+        repo = git_clone(cache_dir)
+    yield repo
+
+
+def git_catalog_removed(run: CatalogRun, removed_paths: Iterable[str], object_names: dict[tuple[str, str], str], written: set) -> None:
+    for path in removed_paths:
+        if (match := _GIT_OBJECT_PATH.match(path)) and (match.group("type"), match.group("id")) not in written:
+            object_key = (match.group("type"), match.group("id"))
+            run.remove(*object_key, object_names.get(object_key, match.group("name")), path)
+
+
+def git_catalog_rebuild(catalog: Catalog) -> int:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        repo = git.Repo.clone_from(config.outputs.git.repo, tmpdirname, bare=True, filter="blob:none")
+        if not repo.head.is_valid():
+            return 0
+        history = repo.git.log("HEAD", "--reverse", "--format=%x01%H %ct", "--raw", "--no-abbrev", "--no-renames", "-z")
+
+    runs: dict[str, CatalogRun] = {}
+    run: CatalogRun | None = None
+    tokens = history.split("\0")
+    token_index = 0
+    while token_index < len(tokens):
+        token = tokens[token_index].lstrip("\n")
+        token_index += 1
+        if token.startswith("\x01"):
+            if run is not None:
+                run.set_versions(run.location)
+            commit, commit_time = token[1:].split(" ")
+            run = runs.setdefault(catalog_run_id(float(commit_time)), CatalogRun("git", float(commit_time)))
+            run.location = commit
+        elif token.startswith(":"):
+            _, _, _, object_hash, status = token[1:].split(" ")
+            path = tokens[token_index]
+            token_index += 1
+            if not (match := _GIT_OBJECT_PATH.match(path)):
+                continue
+            if status == "D":
+                run.remove(match.group("type"), match.group("id"), match.group("name"), path)
+            else:
+                run.add(match.group("type"), match.group("id"), match.group("name"), object_hash, path)
+    if run is not None:
+        run.set_versions(run.location)
+
+    catalog.clear("git")
+    for run in runs.values():
+        if run.objects:
+            catalog.add_run(run)
+    return len(runs)
+
+
+class GitWorktreeWriter:
+    def __init__(self, repo: git.Repo) -> None:
+        self.repo = repo
+        self.written_files: int = 0
+
+    def write(self, path: str, content: bytes) -> None:
+        export_path = Path(self.repo.working_tree_dir) / path
+        Path.mkdir(export_path.parent, exist_ok=True)
+        with Path.open(export_path, "wb") as export_file:
+            export_file.write(content)
+        self.written_files += 1
+
+    def commit(self, removed_paths: list[str]) -> bool:
+        logger = get_logger()
+
+        for chunk_start in range(0, len(removed_paths), _GIT_PATHS_PER_CALL):
+            self.repo.git.rm("-q", "--sparse", "--", *removed_paths[chunk_start : chunk_start + _GIT_PATHS_PER_CALL])
+
+        logger.debug(f"Git: {self.written_files} files written, {len(removed_paths)} removed")
+        if self.written_files or removed_paths:
+            self.repo.git.add(".", "--sparse")
+        repo_changes = self.repo.git.status("--porcelain")
+        if not repo_changes:
+            return False
+
+        logger.debug("Changes to commit:")
+        for change in repo_changes.split("\n"):
+            logger.debug(f"    {change}")
+        self.repo.git.commit("-m", "Exported data")
+        return True
+
+
+class GitFastImportWriter:
+    def __init__(self, repo: git.Repo, tree_hashes: dict[str, str]) -> None:
+        self.repo = repo
+        self.tree_hashes = tree_hashes
+        self.process: git.cmd.Git.AutoInterrupt | None = None
+        self.written_paths: dict[str, int] = {}
+
+    def send(self, *chunks: bytes) -> None:
+        if self.process is None:
+            self.process = self.repo.git.fast_import("--quiet", "--done", as_process=True, istream=subprocess.PIPE)
+        for chunk in chunks:
+            self.process.stdin.write(chunk)
+
+    def write(self, path: str, content: bytes) -> None:
+        mark = len(self.written_paths) + 1
+        self.send(b"blob\nmark :%d\ndata %d\n" % (mark, len(content)), content, b"\n")
+        self.written_paths[path] = mark
+
+    def commit(self, removed_paths: list[str]) -> bool:
+        logger = get_logger()
+
+        logger.debug(f"Git: {len(self.written_paths)} blobs written, {len(removed_paths)} removed")
+        if not self.written_paths and not removed_paths:
+            return False
+
+        logger.debug("Changes to commit:")
+        for path in removed_paths:
+            logger.debug(f"    D  {path}")
+        for path in self.written_paths:
+            logger.debug(f"    {'M' if path in self.tree_hashes else 'A'}  {path}")
+
+        message = b"Exported data"
+        commands = [
+            b"commit refs/heads/%s\n" % self.repo.active_branch.name.encode(),
+            b"committer %s\n" % self.repo.git.var("GIT_COMMITTER_IDENT").encode(),
+            b"data %d\n%s\n" % (len(message), message),
+        ]
+        if self.repo.head.is_valid():
+            commands.append(b"from %s\n" % self.repo.head.commit.hexsha.encode())
+        commands.extend(b"D %s\n" % path.encode() for path in removed_paths)
+        commands.extend(b"M 100644 :%d %s\n" % (mark, path.encode()) for path, mark in self.written_paths.items())
+        commands.append(b"\ndone\n")
+
+        self.send(*commands)
+        self.process.stdin.close()
+        self.process.wait()
+        return True
+
+
+def export_git(data: Iterable[ExportObject], *, complete: bool = True) -> None:
     logger = get_logger()
 
     if config.outputs.git.enable:
@@ -17,42 +232,46 @@ def export_git(data: ExportObjectList) -> None:
             logger.info("Dryrun enabled, skipping git export")
         else:
             logger.info("Writing to git")
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                repo = git.Repo.clone_from(
-                    config.outputs.git.repo,
-                    tmpdirname,
-                    depth=1,
-                    sparse=True,
-                )
-                repo.git.rm("-r", "--sparse", ".")
+            with git_working_copy() as repo:
+                tree_hashes = git_tree_hashes(repo)
+                tree_objects = {} if complete else git_tree_objects(tree_hashes)
+                object_format = repo.git.rev_parse("--show-object-format")
+                writer = GitFastImportWriter(repo, tree_hashes) if config.outputs.git.mode == "plumbing" else GitWorktreeWriter(repo)
 
+                run = CatalogRun("git")
+                object_names: dict = {}
+                written: set = set()
+                exported_paths: set = set()
+                removed_paths: list = []
                 for exportdata in data:
-                    export_dir = Path(tmpdirname) / Path(exportdata.type)
-                    export_filename = Path(f"{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}")
-                    export_path = export_dir / export_filename
-
-                    Path.mkdir(export_dir, exist_ok=True)
-
-                    if config.inputs.model_dump()[exportdata.type]["encryption"]:
-                        with Path.open(export_path, "wb") as export_file:
-                            export_file.write(
-                                encrypt(
-                                    content=exportdata.data,
-                                    key=config.general.encryption_key,
-                                    deterministic=config.inputs.model_dump()[exportdata.type]["encryption_deterministic"]
-                                )
-                            )
-                    else:
-                        with Path.open(export_path, "w") as export_file:
-                            export_file.write(exportdata.data)
-
-                repo.git.add(".", "--sparse")
-                repo_changes = repo.git.status("--porcelain")
-                if repo_changes:
-                    logger.debug("Changes to commit:")
-                    for change in repo_changes.split("\n"):
-                        logger.debug(f"    {change}")
-                    repo.git.commit("-m", "Exported data")
-                    repo.git.push()
+                    object_names[(exportdata.type, str(exportdata.id))] = exportdata.name
+                    export_path = f"{exportdata.type}/{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}"
+                    exported_paths.add(export_path)
+                    removed_paths.extend(
+                        path
+                        for path in tree_objects.get((exportdata.type, str(exportdata.id)), [])
+                        if path != export_path or exportdata.deleted
+                    )
+                    if exportdata.deleted or exportdata.data is None:
+                        continue
+
+                    written.add((exportdata.type, str(exportdata.id)))
+                    blob_hash = git_blob_hash(exportdata.payload, object_format)
+                    if tree_hashes.get(export_path) != blob_hash:
+                        with metrics.timer("git_write", exportdata.type):
+                            writer.write(export_path, exportdata.payload)
+                        metrics.count("git_bytes", len(exportdata.payload), exportdata.type)
+                        run.add(exportdata.type, exportdata.id, exportdata.name, blob_hash, export_path)
+
+                if complete:
+                    removed_paths = [path for path in tree_hashes if path not in exported_paths]
+                with metrics.timer("git_commit"):
+                    committed = writer.commit(removed_paths)
+                if committed:
+                    with metrics.timer("git_push"):
+                        repo.git.push("origin", f"refs/heads/{repo.active_branch.name}")
+                    git_catalog_removed(run, removed_paths, object_names, written)
+                    run.set_versions(repo.head.commit.hexsha)
+                    run.save(repo.head.commit.hexsha, complete=complete)
     else:
         logger.debug("Git output disabled")
@@ -1,22 +1,335 @@
+import bisect
 import datetime
+import hashlib
+import hmac
 import io
+import json
+import os
+import random
+import re
+import time
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
 
+import certifi
+import urllib3
 from minio import Minio
 from minio.commonconfig import ENABLED, GOVERNANCE
+from minio.error import S3Error, ServerError
 from minio.lifecycleconfig import AbortIncompleteMultipartUpload, LifecycleConfig, NoncurrentVersionExpiration
 from minio.lifecycleconfig import Filter as LCFilter
 from minio.lifecycleconfig import Rule as LCRule
 from minio.retention import Retention
 from minio.versioningconfig import VersioningConfig
 
+from modules.catalog import Catalog, CatalogRun, catalog_run_id
 from modules.config import config
-from modules.crypto import encrypt
+from modules.exceptions import S3UploadError
 from modules.logger import get_logger
-from modules.models import ExportObjectList
+from modules.metrics import metrics
+from modules.models import ExportObject
 
+_S3_MANIFEST_NAME: str = "zabbup-manifest.json"
+_S3_OBJECT_PATH = re.compile(r"^(?P<type>[^/]+)/(?P<name>[^/]*)_(?P<id>\d+)\.[^/.]+$")
+_S3_RETRY_CODES: set = {"InternalError", "RequestTimeout", "ServiceUnavailable", "SlowDown", "Throttling", "ThrottlingException"}
+_S3_RETRY_BASE_DELAY: float = 0.5
+_S3_RETRY_MAX_DELAY: float = 30
+_S3_PROGRESS_INTERVAL: int = 10
 
-def export_s3(data: ExportObjectList) -> None:
+
+def s3_client_create() -> Minio:
+    timeout = datetime.timedelta(minutes=5).seconds
+    http_client = urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        maxsize=config.outputs.s3.max_uploads,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=False,
+    )
+    return Minio(
+        endpoint=config.outputs.s3.url,
+        access_key=config.outputs.s3.access_key,
+        secret_key=config.outputs.s3.secret_key,
+        http_client=http_client,
+    )
+
+
+def s3_retryable(error: Exception) -> bool:
+    if isinstance(error, S3Error):
+        return error.code in _S3_RETRY_CODES
+    return isinstance(error, (ServerError, urllib3.exceptions.HTTPError))
+
+
+def s3_upload_object(
+    s3_client: Minio, object_name: str, s3_data: bytes, *, retention: bool = True, export_type: str | None = None
+) -> str | None:
+    logger = get_logger()
+
+    attempt = 0
+    while True:
+        s3_retention_rule = None
+        if retention:
+            s3_retention_rule = Retention(
+                GOVERNANCE,
+                datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(days=config.outputs.s3.retention.days),
+            )
+        try:
+            with metrics.timer("s3_upload", export_type):
+                version_id = s3_client.put_object(
+                    bucket_name=config.outputs.s3.bucket,
+                    object_name=object_name,
+                    data=io.BytesIO(s3_data),
+                    length=len(s3_data),
+                    retention=s3_retention_rule,
+                ).version_id
+        except (S3Error, ServerError, urllib3.exceptions.HTTPError) as e:
+            if attempt >= config.outputs.s3.max_retries or not s3_retryable(e):
+                metrics.count("s3_errors", export_type=export_type)
+                raise
+            metrics.count("s3_retries", export_type=export_type)
+            delay = min(_S3_RETRY_MAX_DELAY, _S3_RETRY_BASE_DELAY * 2**attempt) * random.uniform(0.5, 1)  # noqa: S311
+            logger.debug(f"S3[{config.outputs.s3.bucket}]: Upload of {object_name} failed, retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            attempt += 1
+        else:
+            metrics.count("s3_bytes", len(s3_data), export_type)
+            return version_id
+
+
+class S3Uploader:
+    def __init__(self, s3_client: Minio, *, retention: bool = True) -> None:
+        self.s3_client = s3_client
+        self.retention = retention
+        self.executor = ThreadPoolExecutor(max_workers=config.outputs.s3.max_uploads, thread_name_prefix="s3-upload")
+        self.pending: dict[Future, str] = {}
+        self.uploaded: int = 0
+        self.unchanged: int = 0
+        self.failed: list[str] = []
+        self.versions: dict[str, str | None] = {}
+        self.last_progress = time.monotonic()
+
+    def submit(self, object_name: str, s3_data: bytes, export_type: str | None = None) -> None:
+        if len(self.pending) >= 2 * config.outputs.s3.max_uploads:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            self.collect(done)
+        logger = get_logger()
+        logger.debug(f"S3[{config.outputs.s3.bucket}]: Uploading file {object_name}")
+        future = self.executor.submit(
+            s3_upload_object, self.s3_client, object_name, s3_data, retention=self.retention, export_type=export_type
+        )
+        self.pending[future] = object_name
+
+    def collect(self, done: set[Future]) -> None:
+        logger = get_logger()
+
+        for future in done:
+            object_name = self.pending.pop(future)
+            try:
+                self.versions[object_name] = future.result()
+            except (S3Error, ServerError, urllib3.exceptions.HTTPError) as e:
+                logger.error(f"S3[{config.outputs.s3.bucket}]: Upload of {object_name} failed: {e}")
+                self.failed.append(object_name)
+            else:
+                self.uploaded += 1
+
+        if time.monotonic() - self.last_progress >= _S3_PROGRESS_INTERVAL:
+            self.last_progress = time.monotonic()
+            logger.info(f"S3[{config.outputs.s3.bucket}]: {self.progress()}")
+
+    def progress(self) -> str:
+        return f"{self.uploaded} files uploaded, {self.unchanged} unchanged, {len(self.failed)} failed, {len(self.pending)} in progress"
+
+    def finish(self) -> None:
+        self.collect(wait(self.pending).done)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+def s3_delete_object(s3_client: Minio, exportdata: ExportObject) -> list[str]:
+    logger = get_logger()
+
+    removed_objects: list = []
+    export_dir = Path(config.outputs.s3.bucket_path) / Path(exportdata.type)
+    export_suffix = f"_{exportdata.id}.{config.zabbix.export_format}"
+    for s3_object in s3_client.list_objects(config.outputs.s3.bucket, prefix=f"{export_dir}/"):
+        if s3_object.object_name.endswith(export_suffix):
+            logger.debug(f"S3[{config.outputs.s3.bucket}]: Removing file {s3_object.object_name}")
+            s3_client.remove_object(config.outputs.s3.bucket, s3_object.object_name)
+            removed_objects.append(s3_object.object_name)
+    return removed_objects
+
+
+def s3_load_manifest(s3_client: Minio) -> dict[str, str]:
+    logger = get_logger()
+
+    if not config.outputs.s3.manifest:
+        return {}
+
+    manifest_path = str(Path(config.outputs.s3.bucket_path) / _S3_MANIFEST_NAME)
+    try:
+        response = s3_client.get_object(config.outputs.s3.bucket, manifest_path)
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        logger.info(f"S3[{config.outputs.s3.bucket}]: No manifest found, uploading all files")
+        return {}
+
+    try:
+        return json.loads(response.read())["objects"]
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def s3_save_manifest(s3_client: Minio, manifest: dict[str, str]) -> None:
+    logger = get_logger()
+
+    if not config.outputs.s3.manifest:
+        return
+
+    manifest_path = str(Path(config.outputs.s3.bucket_path) / _S3_MANIFEST_NAME)
+    manifest_data = json.dumps({"objects": manifest}, sort_keys=True).encode()
+    s3_client.put_object(
+        bucket_name=config.outputs.s3.bucket,
+        object_name=manifest_path,
+        data=io.BytesIO(manifest_data),
+        length=len(manifest_data),
+        content_type="application/json",
+    )
+    logger.debug(f"S3[{config.outputs.s3.bucket}]: Manifest with {len(manifest)} files written")
+
+
+def s3_catalog_rebuild(catalog: Catalog) -> int:
+    s3_client = s3_client_create()
+    bucket_path = Path(config.outputs.s3.bucket_path)
+    manifest_path = str(bucket_path / _S3_MANIFEST_NAME)
+    prefix = "" if str(bucket_path) == "." else f"{bucket_path}/"
+
+    versions = sorted(
+        s3_client.list_objects(config.outputs.s3.bucket, prefix=prefix, recursive=True, include_version=True),
+        key=lambda s3_object: s3_object.last_modified,
+    )
+    manifests = [s3_object for s3_object in versions if s3_object.object_name == manifest_path and not s3_object.is_delete_marker]
+    manifest_times = [manifest.last_modified for manifest in manifests]
+
+    runs: dict[str, CatalogRun] = {}
+    object_versions: dict[str, dict] = {}
+    manifest_hashes: dict[str, dict] = {}
+    for s3_object in versions:
+        match = _S3_OBJECT_PATH.match(s3_object.object_name.removeprefix(prefix))
+        if not match:
+            continue
+
+        manifest_index = bisect.bisect_left(manifest_times, s3_object.last_modified)
+        manifest = manifests[manifest_index] if manifest_index < len(manifests) else None
+        created = (manifest or s3_object).last_modified.timestamp()
+        run = runs.setdefault(catalog_run_id(created), CatalogRun("s3", created))
+        object_versions.setdefault(run.run_id, {})[s3_object.object_name] = s3_object.version_id
+        if s3_object.is_delete_marker:
+            run.remove(match.group("type"), match.group("id"), match.group("name"), s3_object.object_name)
+            continue
+
+        content_hash = f"etag:{s3_object.etag}"
+        if manifest is not None:
+            if manifest.version_id not in manifest_hashes:
+                response = s3_client.get_object(config.outputs.s3.bucket, manifest_path, version_id=manifest.version_id)
+                try:
+                    manifest_hashes[manifest.version_id] = json.loads(response.read())["objects"]
+                finally:
+                    response.close()
+                    response.release_conn()
+            content_hash = manifest_hashes[manifest.version_id].get(s3_object.object_name, content_hash)
+        run.add(match.group("type"), match.group("id"), match.group("name"), content_hash, s3_object.object_name)
+
+    catalog.clear("s3")
+    for run in runs.values():
+        run.set_versions(object_versions[run.run_id])
+        run.location = f"s3://{config.outputs.s3.bucket}/{config.outputs.s3.bucket_path}"
+        catalog.add_run(run)
+    return len(runs)
+
+
+def s3_encryption_encoding() -> str:
+    if config.general.encryption_format == "aesgcm" and config.general.encryption_compress:
+        return "aesgcm+zlib"
+    return config.general.encryption_format
+
+
+def s3_plaintext_hmac(exportdata: ExportObject) -> str:
+    encoding = s3_encryption_encoding()
+    return hmac.new(config.general.encryption_key.encode(), f"{encoding}\n".encode() + exportdata.data, hashlib.sha256).hexdigest()
+
+
+def s3_content_hash(exportdata: ExportObject) -> str:
+    if exportdata.encrypted and not config.input_settings[exportdata.type].encryption_deterministic:
+        return f"hmac-sha256:{s3_encryption_encoding()}:{s3_plaintext_hmac(exportdata)}"
+    return f"sha256:{hashlib.sha256(exportdata.payload).hexdigest()}"
+
+
+def s3_prepare_bucket(s3_client: Minio) -> None:
+    logger = get_logger()
+
+    s3_bucket_versioningconfig = s3_client.get_bucket_versioning(config.outputs.s3.bucket)
+    if s3_bucket_versioningconfig.status != "Enabled":
+        logger.warning(f"S3[{config.outputs.s3.bucket}]: bucket versioning is not enabled")
+        logger.info(f"S3[{config.outputs.s3.bucket}]: Enabling bucket versioning")
+        s3_client.set_bucket_versioning(config.outputs.s3.bucket, VersioningConfig(ENABLED))
+    else:
+        logger.info(f"S3[{config.outputs.s3.bucket}]: bucket versioning is enabled")
+
+    lifecycle_config = LifecycleConfig(
+        [
+            LCRule(
+                rule_id="zabbup-delete-old-backups",
+                status="Enabled",
+                abort_incomplete_multipart_upload=AbortIncompleteMultipartUpload(days_after_initiation=1),
+                # rule_filter=LCFilter(prefix=config.outputs.s3.bucket_path),
+                # rule_filter=LCFilter(prefix="/"),
+                rule_filter=LCFilter(prefix=""),
+                # expiration=Expiration(days=config.outputs.s3.lifecycle.days),
+                noncurrent_version_expiration=NoncurrentVersionExpiration(noncurrent_days=config.outputs.s3.lifecycle.days),
+            ),
+        ],
+    )
+
+    s3_client.set_bucket_lifecycle(config.outputs.s3.bucket, lifecycle_config)
+
+
+def s3_export_object(
+    uploader: S3Uploader,
+    run: CatalogRun,
+    exportdata: ExportObject,
+    previous_manifest: dict[str, str],
+    manifest: dict[str, str],
+) -> None:
+    if exportdata.deleted:
+        for object_name in s3_delete_object(uploader.s3_client, exportdata):
+            manifest.pop(object_name, None)
+            run.remove(exportdata.type, exportdata.id, exportdata.name, object_name)
+        return
+
+    export_dir = Path(config.outputs.s3.bucket_path) / Path(exportdata.type)
+    export_filename = Path(f"{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}")
+    export_path = export_dir / export_filename
+
+    if exportdata.data is None:
+        if str(export_path) in previous_manifest:
+            manifest[str(export_path)] = previous_manifest[str(export_path)]
+        return
+
+    content_hash = s3_content_hash(exportdata)
+    manifest[str(export_path)] = content_hash
+    if previous_manifest.get(str(export_path)) == content_hash:
+        uploader.unchanged += 1
+        return
+
+    uploader.submit(str(export_path), exportdata.payload, exportdata.type)
+    run.add(exportdata.type, exportdata.id, exportdata.name, content_hash, str(export_path))
+
+
+def export_s3(data: Iterable[ExportObject], *, complete: bool = True) -> None:
     logger = get_logger()
 
     if config.outputs.s3.enable:
@@ -25,65 +338,31 @@ def export_s3(data: ExportObjectList) -> None:
         else:
             logger.info("Writing to S3")
 
-            s3_client = Minio(
-                endpoint=config.outputs.s3.url,
-                access_key=config.outputs.s3.access_key,
-                secret_key=config.outputs.s3.secret_key,
-            )
+            s3_client = s3_client_create()
+            s3_prepare_bucket(s3_client)
 
-            s3_bucket_versioningconfig = s3_client.get_bucket_versioning(config.outputs.s3.bucket)
-            if s3_bucket_versioningconfig.status != "Enabled":
-                logger.warning(f"S3[{config.outputs.s3.bucket}]: bucket versioning is not enabled")
-                logger.info(f"S3[{config.outputs.s3.bucket}]: Enabling bucket versioning")
-                s3_client.set_bucket_versioning(config.outputs.s3.bucket, VersioningConfig(ENABLED))
-            else:
-                logger.info(f"S3[{config.outputs.s3.bucket}]: bucket versioning is enabled")
-
-            lifecycle_config = LifecycleConfig(
-                [
-                    LCRule(
-                        rule_id="zabbup-delete-old-backups",
-                        status="Enabled",
-                        abort_incomplete_multipart_upload=AbortIncompleteMultipartUpload(days_after_initiation=1),
-                        # rule_filter=LCFilter(prefix=config.outputs.s3.bucket_path),
-                        # rule_filter=LCFilter(prefix="/"),
-                        rule_filter=LCFilter(prefix=""),
-                        # expiration=Expiration(days=config.outputs.s3.lifecycle.days),
-                        noncurrent_version_expiration=NoncurrentVersionExpiration(noncurrent_days=config.outputs.s3.lifecycle.days),
-                    ),
-                ],
-            )
+            previous_manifest = s3_load_manifest(s3_client)
+            manifest = {} if complete else dict(previous_manifest)
+            uploader = S3Uploader(s3_client)
+            run = CatalogRun("s3")
+            try:
+                for exportdata in data:
+                    s3_export_object(uploader, run, exportdata, previous_manifest, manifest)
 
-            s3_client.set_bucket_lifecycle(config.outputs.s3.bucket, lifecycle_config)
-
-            for exportdata in data:
-                export_dir = Path(config.outputs.s3.bucket_path) / Path(exportdata.type)
-                export_filename = Path(f"{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}")
-                export_path = export_dir / export_filename
-
-                logger.debug(f"S3[{config.outputs.s3.bucket}]: Uploading file {export_path}")
-
-                if config.inputs.model_dump()[exportdata.type]["encryption"]:
-                    s3_data = encrypt(
-                        content=exportdata.data,
-                        key=config.general.encryption_key,
-                        deterministic=config.inputs.model_dump()[exportdata.type]["encryption_deterministic"]
-                    )
-                else:
-                    s3_data = exportdata.data.encode()
-
-                s3_retention_rule = Retention(
-                    GOVERNANCE,
-                    datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(days=config.outputs.s3.retention.days),
-                )
-                s3_client.put_object(
-                    bucket_name=config.outputs.s3.bucket,
-                    object_name=str(export_path),
-                    data=io.BytesIO(s3_data),
-                    length=len(s3_data),
-                    retention=s3_retention_rule,
-                )
+                uploader.finish()
+            finally:
+                uploader.close()
 
+            logger.info(f"S3[{config.outputs.s3.bucket}]: {uploader.progress()}")
+            for object_name in uploader.failed:
+                manifest.pop(object_name, None)
+            if manifest != previous_manifest:
+                s3_save_manifest(s3_client, manifest)
+            run.discard(uploader.failed)
+            run.set_versions(uploader.versions)
+            run.save(f"s3://{config.outputs.s3.bucket}/{config.outputs.s3.bucket_path}", complete=complete)
+            if uploader.failed:
+                raise S3UploadError(uploader.failed)
 
     else:
         logger.debug("S3 output disabled")
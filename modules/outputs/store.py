@@ -0,0 +1,245 @@
+import datetime as dt
+import hashlib
+import io
+import json
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from minio.deleteobjects import DeleteObject
+
+from modules.config import config
+from modules.exceptions import S3UploadError
+from modules.logger import get_logger
+from modules.models import ExportObject
+from modules.outputs.s3 import S3Uploader, s3_client_create, s3_plaintext_hmac
+from modules.state import backup_state
+
+_STORE_GC_GRACE: int = 86400
+
+
+def store_address(exportdata: ExportObject) -> str:
+    if exportdata.encrypted:
+        return s3_plaintext_hmac(exportdata)
+    return hashlib.sha256(exportdata.payload).hexdigest()
+
+
+def store_object_path(address: str) -> str:
+    return f"objects/{address[:2]}/{address}"
+
+
+class LocalStore:
+    def __init__(self) -> None:
+        self.root = Path(config.outputs.store.path)
+
+    def write(self, path: Path, content: bytes) -> None:
+        Path.mkdir(path.parent, parents=True, exist_ok=True)
+        path_tmp = path.with_name(f"{path.name}.tmp")
+        with Path.open(path_tmp, "wb") as store_file:
+            store_file.write(content)
+        path_tmp.replace(path)
+
+    def has_object(self, address: str) -> bool:
+        return (self.root / store_object_path(address)).exists()
+
+    def put_object(self, address: str, content: bytes) -> None:
+        self.write(self.root / store_object_path(address), content)
+
+    def get_object(self, address: str) -> bytes:
+        with Path.open(self.root / store_object_path(address), "rb") as store_file:
+            return store_file.read()
+
+    def finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def list_objects(self) -> dict[str, float]:
+        return {path.name: path.stat().st_mtime for path in (self.root / "objects").glob("*/*") if not path.name.endswith(".tmp")}
+
+    def delete_objects(self, addresses: list[str]) -> None:
+        for address in addresses:
+            (self.root / store_object_path(address)).unlink(missing_ok=True)
+
+    def list_snapshots(self) -> list[str]:
+        return sorted(path.name for path in (self.root / "snapshots").glob("*.json"))
+
+    def get_snapshot(self, name: str) -> dict:
+        with Path.open(self.root / "snapshots" / name, "r") as snapshot_file:
+            return json.load(snapshot_file)
+
+    def put_snapshot(self, name: str, snapshot: dict) -> None:
+        self.write(self.root / "snapshots" / name, json.dumps(snapshot).encode())
+
+    def delete_snapshot(self, name: str) -> None:
+        (self.root / "snapshots" / name).unlink()
+
+
+class S3Store:
+    def __init__(self) -> None:
+        self.s3_client = s3_client_create()
+        self.prefix = Path(config.outputs.store.path)
+        self.objects = {
+            Path(s3_object.object_name).name: s3_object.last_modified.timestamp()
+            for s3_object in self.s3_client.list_objects(config.outputs.s3.bucket, prefix=f"{self.prefix / 'objects'}/", recursive=True)
+        }
+        self.uploader = S3Uploader(self.s3_client, retention=False)
+
+    def has_object(self, address: str) -> bool:
+        return address in self.objects
+
+    def put_object(self, address: str, content: bytes) -> None:
+        self.uploader.submit(str(self.prefix / store_object_path(address)), content)
+        self.objects[address] = time.time()
+
+    def get_object(self, address: str) -> bytes:
+        response = self.s3_client.get_object(config.outputs.s3.bucket, str(self.prefix / store_object_path(address)))
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def finish(self) -> None:
+        self.uploader.finish()
+        if self.uploader.failed:
+            raise S3UploadError(self.uploader.failed)
+
+    def close(self) -> None:
+        self.uploader.close()
+
+    def list_objects(self) -> dict[str, float]:
+        return self.objects
+
+    def delete_objects(self, addresses: list[str]) -> None:
+        logger = get_logger()
+        delete_objects = [DeleteObject(str(self.prefix / store_object_path(address))) for address in addresses]
+        for error in self.s3_client.remove_objects(config.outputs.s3.bucket, delete_objects):
+            logger.warning(f"Store: Removing {error.name} failed: {error.message}")
+
+    def list_snapshots(self) -> list[str]:
+        return sorted(
+            Path(s3_object.object_name).name
+            for s3_object in self.s3_client.list_objects(config.outputs.s3.bucket, prefix=f"{self.prefix / 'snapshots'}/")
+            if s3_object.object_name.endswith(".json")
+        )
+
+    def get_snapshot(self, name: str) -> dict:
+        response = self.s3_client.get_object(config.outputs.s3.bucket, str(self.prefix / "snapshots" / name))
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
+    def put_snapshot(self, name: str, snapshot: dict) -> None:
+        snapshot_data = json.dumps(snapshot).encode()
+        self.s3_client.put_object(
+            bucket_name=config.outputs.s3.bucket,
+            object_name=str(self.prefix / "snapshots" / name),
+            data=io.BytesIO(snapshot_data),
+            length=len(snapshot_data),
+            content_type="application/json",
+        )
+
+    def delete_snapshot(self, name: str) -> None:
+        self.s3_client.remove_object(config.outputs.s3.bucket, str(self.prefix / "snapshots" / name))
+
+
+def store_write(store: LocalStore | S3Store, data: Iterable[ExportObject], previous: dict, *, complete: bool) -> tuple[dict, int, int]:
+    logger = get_logger()
+
+    objects: dict = {} if complete else dict(previous)
+    object_paths = {(entry["type"], entry["id"]): path for path, entry in objects.items()}
+    previous_paths = {(entry["type"], entry["id"]): path for path, entry in previous.items()}
+
+    stored_objects: int = 0
+    missing_objects: int = 0
+    for exportdata in data:
+        previous_path = object_paths.pop((exportdata.type, str(exportdata.id)), None)
+        if previous_path is not None:
+            del objects[previous_path]
+        if exportdata.deleted:
+            continue
+
+        export_path = f"{exportdata.type}/{exportdata.name_sanitized}_{exportdata.id}.{config.zabbix.export_format}"
+        if exportdata.data is None:
+            previous_path = previous_paths.get((exportdata.type, str(exportdata.id)))
+            if previous_path is not None:
+                objects[export_path] = {**previous[previous_path], "name": exportdata.name}
+            else:
+                logger.warning(f"Store: Unchanged {exportdata.type} {exportdata.name} is not in the last snapshot, exporting it next run")
+                backup_state.forget(exportdata.type, exportdata.id)
+                missing_objects += 1
+            continue
+
+        address = store_address(exportdata)
+        objects[export_path] = {
+            "type": exportdata.type,
+            "id": str(exportdata.id),
+            "name": exportdata.name,
+            "hash": address,
+            "encrypted": exportdata.encrypted,
+        }
+        if not store.has_object(address):
+            store.put_object(address, exportdata.payload)
+            stored_objects += 1
+
+    store.finish()
+    return objects, stored_objects, missing_objects
+
+
+def store_prune(store: LocalStore | S3Store) -> None:
+    logger = get_logger()
+
+    snapshots = store.list_snapshots()
+    for name in snapshots[: -config.outputs.store.keep_snapshots]:
+        logger.debug(f"Store: Removing snapshot {name}")
+        store.delete_snapshot(name)
+
+    referenced: set = set()
+    for name in snapshots[-config.outputs.store.keep_snapshots :]:
+        referenced.update(entry["hash"] for entry in store.get_snapshot(name)["objects"].values())
+
+    gc_before = time.time() - _STORE_GC_GRACE
+    unreferenced = [address for address, modified in store.list_objects().items() if address not in referenced and modified < gc_before]
+    if unreferenced:
+        logger.info(f"Store: Removing {len(unreferenced)} unreferenced objects")
+        store.delete_objects(unreferenced)
+
+
+def export_store(data: Iterable[ExportObject], *, complete: bool = True) -> None:
+    logger = get_logger()
+
+    if config.outputs.store.enable:
+        if config.general.dryrun:
+            logger.info("Dryrun enabled, skipping store export")
+        else:
+            logger.info(f"Writing to {config.outputs.store.storage} store")
+            store = S3Store() if config.outputs.store.storage == "s3" else LocalStore()
+            try:
+                snapshots = store.list_snapshots()
+                previous = store.get_snapshot(snapshots[-1])["objects"] if snapshots else {}
+                objects, stored_objects, missing_objects = store_write(store, data, previous, complete=complete)
+            finally:
+                store.close()
+
+            if objects == previous and not missing_objects:
+                logger.info("Store: Nothing changed since the last snapshot")
+            else:
+                name = f"{dt.datetime.now(tz=dt.UTC):%Y%m%dT%H%M%S%fZ}.json"
+                store.put_snapshot(
+                    name,
+                    {
+                        "created": dt.datetime.now(tz=dt.UTC).isoformat(),
+                        "export_format": config.zabbix.export_format,
+                        "complete": not missing_objects,
+                        "objects": objects,
+                    },
+                )
+                logger.info(f"Store: Snapshot {name} with {len(objects)} files written, {stored_objects} new objects stored")
+
+            store_prune(store)
+    else:
+        logger.debug("Store output disabled")
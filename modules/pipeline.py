@@ -0,0 +1,110 @@
+import collections
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from modules.config import config
+from modules.crypto import encrypt
+from modules.exceptions import ExportStreamAbortedError
+from modules.logger import get_logger
+from modules.metrics import metrics
+from modules.models import ExportObject, ExportObjectStream
+
+_ENCRYPT_POOL_THRESHOLD: int = 64 * 1024
+
+
+def pipeline_payload(exportdata: ExportObject) -> bytes:
+    export_settings = config.input_settings[exportdata.type]
+    if export_settings.encryption:
+        with metrics.timer("encrypt", exportdata.type):
+            return encrypt(
+                content=exportdata.data,
+                key=config.general.encryption_key,
+                deterministic=export_settings.encryption_deterministic,
+                container=config.general.encryption_format == "aesgcm",
+                compress=config.general.encryption_compress,
+            )
+    return exportdata.data
+
+
+def pipeline_encrypt(source: Iterable[ExportObject]) -> Iterator[ExportObject]:
+    pending: collections.deque[tuple[ExportObject, Future | None]] = collections.deque()
+    with ThreadPoolExecutor(thread_name_prefix="encrypt") as executor:
+        try:
+            for exportdata in source:
+                pipeline_count(exportdata)
+                if exportdata.data is not None and not exportdata.deleted:
+                    exportdata.encrypted = config.input_settings[exportdata.type].encryption
+                    if exportdata.encrypted and len(exportdata.data) >= _ENCRYPT_POOL_THRESHOLD:
+                        pending.append((exportdata, executor.submit(pipeline_payload, exportdata)))
+                    else:
+                        exportdata.payload = pipeline_payload(exportdata)
+                        pending.append((exportdata, None))
+                else:
+                    pending.append((exportdata, None))
+
+                while pending and (pending[0][1] is None or pending[0][1].done() or len(pending) > config.general.queue_size):
+                    yield pipeline_resolve(*pending.popleft())
+
+            while pending:
+                yield pipeline_resolve(*pending.popleft())
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+
+def pipeline_count(exportdata: ExportObject) -> None:
+    if exportdata.deleted:
+        metrics.count("objects_deleted", export_type=exportdata.type)
+    elif exportdata.data is None:
+        metrics.count("objects_unchanged", export_type=exportdata.type)
+    else:
+        metrics.count("objects", export_type=exportdata.type)
+        metrics.count("bytes", len(exportdata.data), exportdata.type)
+
+
+def pipeline_resolve(exportdata: ExportObject, future: Future | None) -> ExportObject:
+    if future is not None:
+        exportdata.payload = future.result()
+    return exportdata
+
+
+def pipeline_sink_worker(name: str, sink: Callable, stream: ExportObjectStream, errors: dict) -> None:
+    logger = get_logger()
+    try:
+        sink(stream)
+    except ExportStreamAbortedError:
+        logger.warning(f"Output - {name}: aborted")
+    except Exception as e:
+        errors[name] = e
+    finally:
+        stream.detach()
+
+
+def run_pipeline(source: Iterable[ExportObject], sinks: dict[str, Callable[[Iterable[ExportObject]], None]]) -> dict[str, Exception]:
+    errors: dict[str, Exception] = {}
+    streams: dict[str, ExportObjectStream] = {name: ExportObjectStream(maxsize=config.general.queue_size) for name in sinks}
+    threads: list[threading.Thread] = [
+        threading.Thread(target=pipeline_sink_worker, args=(name, sink, streams[name], errors), name=f"output-{name}")
+        for name, sink in sinks.items()
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for exportdata in pipeline_encrypt(source):
+            for stream in streams.values():
+                stream.put(exportdata)
+    except BaseException:
+        for stream in streams.values():
+            stream.abort()
+        raise
+    else:
+        for stream in streams.values():
+            stream.close()
+    finally:
+        for thread in threads:
+            thread.join()
+
+    return errors
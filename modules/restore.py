@@ -0,0 +1,262 @@
+import collections
+import json
+import re
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import yaml
+
+from modules.config import config
+from modules.crypto import decrypt_container, get_cipher, is_encrypted
+from modules.exceptions import RestorePathError, RestoreSnapshotNotFoundError, RestoreSourceError
+from modules.logger import get_logger
+from modules.outputs.s3 import s3_client_create
+from modules.outputs.store import LocalStore, S3Store
+from modules.zapi import zapi_pool
+
+RESTORE_TYPE_ORDER: list[str] = ["images", "mediatypes", "hostgroups", "templategroups", "templates", "hosts", "maps"]
+
+_RESTORE_PATH = re.compile(rf"(?:^|/)(?P<type>{'|'.join(RESTORE_TYPE_ORDER)})/[^/]*_\d+\.(?P<format>yaml|json|xml)$")
+_RESTORE_RULES_OBJECTS: list[str] = [
+    "hosts",
+    "templates",
+    "items",
+    "triggers",
+    "graphs",
+    "discoveryRules",
+    "httptests",
+    "valueMaps",
+    "templateDashboards",
+    "maps",
+    "images",
+    "mediaTypes",
+]
+
+
+class LocalRestoreSource:
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def paths(self) -> list[str]:
+        return sorted(str(path.relative_to(self.root)) for path in self.root.rglob("*") if path.is_file())
+
+    def read(self, path: str) -> bytes:
+        with Path.open(self.root / path, "rb") as source_file:
+            return source_file.read()
+
+
+class S3RestoreSource:
+    def __init__(self, bucket: str, prefix: str) -> None:
+        self.s3_client = s3_client_create()
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def paths(self) -> list[str]:
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        return sorted(
+            s3_object.object_name.removeprefix(prefix)
+            for s3_object in self.s3_client.list_objects(self.bucket, prefix=prefix, recursive=True)
+        )
+
+    def read(self, path: str) -> bytes:
+        response = self.s3_client.get_object(self.bucket, f"{self.prefix}/{path}" if self.prefix else path)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+
+class SnapshotRestoreSource:
+    def __init__(self, name: str) -> None:
+        logger = get_logger()
+
+        self.store = S3Store() if config.outputs.store.storage == "s3" else LocalStore()
+        snapshots = self.store.list_snapshots()
+        if name == "latest" and snapshots:
+            name = snapshots[-1]
+        elif f"{name.removesuffix('.json')}.json" in snapshots:
+            name = f"{name.removesuffix('.json')}.json"
+        else:
+            raise RestoreSnapshotNotFoundError(name)
+        self.name = name
+        snapshot = self.store.get_snapshot(name)
+        if not snapshot.get("complete", True):
+            logger.warning(f"Store: Snapshot {name} is incomplete, unchanged files missing in the store were not recorded")
+        self.objects = snapshot["objects"]
+
+    def paths(self) -> list[str]:
+        return sorted(self.objects)
+
+    def read(self, path: str) -> bytes:
+        return self.store.get_object(self.objects[path]["hash"])
+
+
+RestoreSource = LocalRestoreSource | S3RestoreSource | SnapshotRestoreSource
+
+
+def restore_source(source: str | None, snapshot: str | None) -> RestoreSource:
+    if snapshot is not None:
+        return SnapshotRestoreSource(snapshot)
+
+    if source is not None and source.startswith("s3://"):
+        source_url = urlparse(source)
+        if source_url.netloc:
+            return S3RestoreSource(source_url.netloc, source_url.path)
+    elif source is not None and Path(source).is_dir():
+        return LocalRestoreSource(source)
+    raise RestoreSourceError(source)
+
+
+def restore_select(paths: Iterable[str], types: set[str] | None) -> list[tuple[str, str]]:
+    selected: list = []
+    for path in paths:
+        if (match := _RESTORE_PATH.search(path)) and (types is None or match.group("type") in types):
+            selected.append((path, match.group("type")))
+    return selected
+
+
+def restore_map(executor: Executor, fn: Callable, items: Iterable[tuple], window: int) -> Iterator[tuple[tuple, Future]]:
+    pending: collections.deque[tuple[tuple, Future]] = collections.deque()
+    try:
+        for args in items:
+            pending.append((args, executor.submit(fn, *args)))
+            if len(pending) >= window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def restore_decrypt(content: bytes, key: str | None) -> bytes:
+    if not is_encrypted(content):
+        return content
+    if content.startswith(b"gAAAAA"):
+        return get_cipher(key).decrypt(content)
+    return decrypt_container(content, key)
+
+
+def restore_write(target: Path, path: str, content: bytes) -> None:
+    target_path = (target / path).resolve()
+    if not target_path.is_relative_to(target.resolve()):
+        raise RestorePathError(path)
+    Path.mkdir(target_path.parent, parents=True, exist_ok=True)
+    with Path.open(target_path, "wb") as target_file:
+        target_file.write(content)
+
+
+def restore_import_rules() -> dict:
+    zapi = zapi_pool.get()
+    group_rules = ["host_groups", "template_groups"] if zapi.version >= 6.2 else ["groups"]
+
+    rules: dict = {name: {"createMissing": True, "updateExisting": True} for name in group_rules + _RESTORE_RULES_OBJECTS}
+    rules["templateLinkage"] = {"createMissing": True}
+    for name, values in config.restore.rules.items():
+        rules[name] = {**rules.get(name, {}), **values}
+    return rules
+
+
+def restore_merge(documents: list[tuple[str, bytes]]) -> tuple[str, str]:
+    merged: dict = {}
+    seen: set = set()
+    for path, content in documents:
+        export_format = _RESTORE_PATH.search(path).group("format")
+        document = json.loads(content) if export_format == "json" else yaml.safe_load(content)
+        for section, value in document["zabbix_export"].items():
+            if not isinstance(value, list):
+                merged[section] = value
+                continue
+            for entry in value:
+                entry_key = (section, json.dumps(entry, sort_keys=True, default=str))
+                if entry_key not in seen:
+                    seen.add(entry_key)
+                    merged.setdefault(section, []).append(entry)
+    return "json", json.dumps({"zabbix_export": merged}, default=str)
+
+
+def restore_import_batch(documents: list[tuple[str, bytes]], rules: dict) -> None:
+    if len(documents) == 1:
+        path, content = documents[0]
+        export_format, source = _RESTORE_PATH.search(path).group("format"), content.decode()
+    else:
+        export_format, source = restore_merge(documents)
+
+    zapi = zapi_pool.get()
+    zapi.configuration.import_(format=export_format, source=source, rules=rules)
+
+
+def restore_import_type(executor: ThreadPoolExecutor, documents: list[tuple[str, bytes]], rules: dict) -> dict[str, Exception]:
+    logger = get_logger()
+
+    batch_size = config.restore.batch_size
+    batchable = [document for document in documents if not document[0].endswith(".xml")]
+    batches = [batchable[batch_start : batch_start + batch_size] for batch_start in range(0, len(batchable), batch_size)]
+    batches.extend([document] for document in documents if document[0].endswith(".xml"))
+
+    errors: dict[str, Exception] = {}
+    while batches:
+        retry: list = []
+        for batch, future in zip(batches, [executor.submit(restore_import_batch, batch, rules) for batch in batches], strict=True):
+            try:
+                future.result()
+            except Exception as e:
+                if len(batch) > 1:
+                    logger.debug(f"Restore: Batch import of {len(batch)} files failed, retrying one by one: {e}")
+                retry.extend([document] for document in batch)
+                errors.update((path, e) for path, _ in batch)
+            else:
+                for path, _ in batch:
+                    errors.pop(path, None)
+
+        if len(retry) == len(batches) and all(len(batch) == 1 for batch in batches):
+            break
+        batches = retry
+    return errors
+
+
+def restore_import(documents: dict[str, list[tuple[str, bytes]]]) -> dict[str, Exception]:
+    logger = get_logger()
+
+    rules = restore_import_rules()
+    errors: dict[str, Exception] = {}
+    with ThreadPoolExecutor(max_workers=config.restore.max_threads, thread_name_prefix="import") as executor:
+        for restore_type in RESTORE_TYPE_ORDER:
+            if not documents.get(restore_type):
+                continue
+            logger.info(f"Restore: Importing {len(documents[restore_type])} {restore_type}")
+            type_errors = restore_import_type(executor, documents[restore_type], rules)
+            for path, e in type_errors.items():
+                logger.error(f"Restore: Import of {path} failed: {e}")
+            errors.update(type_errors)
+    return errors
+
+
+def restore_fetch(
+    source: RestoreSource,
+    decrypt_executor: Executor,
+    path: str,
+) -> bytes:
+    return decrypt_executor.submit(restore_decrypt, source.read(path), config.general.encryption_key).result()
+
+
+def restore_files(
+    source: RestoreSource,
+    selected: list[tuple[str, str]],
+    decrypt_executor: Executor,
+) -> Iterator[tuple[str, str, bytes | Exception]]:
+    restore_types = dict(selected)
+    with ThreadPoolExecutor(max_workers=config.general.max_threads, thread_name_prefix="fetch") as fetch_executor:
+        for (_, _, path), future in restore_map(
+            fetch_executor,
+            restore_fetch,
+            ((source, decrypt_executor, path) for path, _ in selected),
+            config.general.queue_size,
+        ):
+            try:
+                yield path, restore_types[path], future.result()
+            except Exception as e:
+                yield path, restore_types[path], e
@@ -0,0 +1,99 @@
+import itertools
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import Any
+
+from modules.logger import get_logger
+from modules.metrics import metrics
+
+_WORKER_STOP = object()
+_SOURCE_DONE = object()
+
+
+class ExportScheduler:
+    def __init__(self, max_workers: int, max_pending: int) -> None:
+        self.max_workers = max_workers
+        self.jobs: queue.PriorityQueue = queue.PriorityQueue()
+        self.results: queue.Queue = queue.Queue()
+        self.pending = threading.Semaphore(max_pending)
+        self.stop = threading.Event()
+        self.sequence = itertools.count()
+        self.sources: list[tuple[str, Iterator[tuple[Callable, dict]], int, threading.Semaphore | None]] = []
+        self.outstanding: int = 0
+        self.outstanding_lock = threading.Lock()
+
+    def add_source(self, name: str, jobs: Iterator[tuple[Callable, dict]], priority: int = 0, max_workers: int | None = None) -> None:
+        self.sources.append((name, jobs, priority, threading.Semaphore(max_workers) if max_workers else None))
+
+    def acquire(self, semaphore: threading.Semaphore) -> bool:
+        while not self.stop.is_set():
+            if semaphore.acquire(timeout=0.1):
+                return True
+        return False
+
+    def feeder(self, name: str, jobs: Iterator[tuple[Callable, dict]], priority: int, limit: threading.Semaphore | None) -> None:
+        try:
+            for function, kwargs in jobs:
+                if not self.acquire(self.pending):
+                    return
+                if limit is not None and not self.acquire(limit):
+                    self.pending.release()
+                    return
+                with self.outstanding_lock:
+                    self.outstanding += 1
+                self.jobs.put((-priority, next(self.sequence), function, kwargs, limit, name, time.perf_counter()))
+        except Exception as e:
+            self.results.put((None, e))
+        finally:
+            self.results.put((_SOURCE_DONE, None))
+
+    def worker(self) -> None:
+        while True:
+            _, _, function, kwargs, limit, name, queued = self.jobs.get()
+            if function is _WORKER_STOP:
+                return
+            metrics.observe("queue_wait", time.perf_counter() - queued, name)
+            try:
+                result = (None, None) if self.stop.is_set() else (function(**kwargs), None)
+            except Exception as e:
+                result = (None, e)
+            finally:
+                if limit is not None:
+                    limit.release()
+            self.results.put(result)
+
+    def run(self) -> Iterator[Any]:
+        logger = get_logger()
+
+        workers = [threading.Thread(target=self.worker, name=f"export-worker-{i}", daemon=True) for i in range(self.max_workers)]
+        feeders = [
+            threading.Thread(target=self.feeder, args=(name, jobs, priority, limit), name=f"export-feeder-{name}", daemon=True)
+            for name, jobs, priority, limit in sorted(self.sources, key=lambda source: -source[2])
+        ]
+        for thread in workers + feeders:
+            thread.start()
+
+        sources_running = len(feeders)
+        try:
+            while sources_running or self.outstanding:
+                result, error = self.results.get()
+                if result is _SOURCE_DONE:
+                    sources_running -= 1
+                    continue
+                if error is not None:
+                    raise error
+
+                with self.outstanding_lock:
+                    self.outstanding -= 1
+                self.pending.release()
+                yield result
+        finally:
+            if sources_running or self.outstanding:
+                logger.debug("Stopping export scheduler")
+            self.stop.set()
+            for _ in workers:
+                self.jobs.put((float("inf"), next(self.sequence), _WORKER_STOP, None, None, None, None))
+            for thread in feeders + workers:
+                thread.join()
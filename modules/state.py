@@ -0,0 +1,126 @@
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+from modules.config import config
+from modules.logger import get_logger
+
+_FINGERPRINT_VOLATILE_FIELDS: set = {
+    "active_available",
+    "assigned_proxyid",
+    "available",
+    "disable_until",
+    "error",
+    "errors_from",
+    "ipmi_available",
+    "ipmi_disable_until",
+    "ipmi_error",
+    "ipmi_errors_from",
+    "jmx_available",
+    "jmx_disable_until",
+    "jmx_error",
+    "jmx_errors_from",
+    "lastaccess",
+    "maintenance_from",
+    "maintenance_status",
+    "maintenance_type",
+    "maintenanceid",
+    "snmp_available",
+    "snmp_disable_until",
+    "snmp_error",
+    "snmp_errors_from",
+}
+
+
+def strip_volatile_fields(value: object) -> object:
+    if isinstance(value, dict):
+        return {key: strip_volatile_fields(child) for key, child in value.items() if key not in _FINGERPRINT_VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [strip_volatile_fields(child) for child in value]
+    return value
+
+
+class BackupState:
+    def __init__(self) -> None:
+        self.previous: dict = {}
+        self.current: dict = {"objects": {}}
+        self.last_full_run: float = 0
+        self.full_run: bool = True
+        self.unsplittable: dict[str, set[str]] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return config.general.incremental.enable
+
+    def load(self) -> None:
+        logger = get_logger()
+        self.current = {"objects": {}}
+
+        if not self.enabled:
+            return
+
+        state_file = Path(config.general.incremental.state_file)
+        if state_file.exists():
+            with Path.open(state_file, "r") as file:
+                self.previous = json.load(file)
+            self.last_full_run = self.previous.get("last_full_run", 0)
+            for export_type_name, element_ids in self.previous.get("unsplittable", {}).items():
+                self.unsplittable.setdefault(export_type_name, set()).update(element_ids)
+
+        self.full_run = time.time() - self.last_full_run >= config.general.incremental.full_run_interval
+        if self.full_run:
+            logger.info("Incremental backup: running full export")
+        else:
+            logger.info("Incremental backup: exporting changed objects only")
+
+    def fingerprint(self, element: dict) -> str:
+        return hashlib.sha256(json.dumps(strip_volatile_fields(element), sort_keys=True).encode()).hexdigest()
+
+    def unchanged(self, export_type_name: str, element_id: str, element: dict) -> bool:
+        if not self.enabled:
+            return False
+
+        fingerprint = self.fingerprint(element)
+        with self.lock:
+            self.current["objects"].setdefault(export_type_name, {})[str(element_id)] = fingerprint
+
+        if self.full_run:
+            return False
+        return self.previous.get("objects", {}).get(export_type_name, {}).get(str(element_id)) == fingerprint
+
+    def is_unsplittable(self, export_type_name: str, element_id: str) -> bool:
+        return str(element_id) in self.unsplittable.get(export_type_name, set())
+
+    def mark_unsplittable(self, export_type_name: str, element_id: str) -> None:
+        with self.lock:
+            self.unsplittable.setdefault(export_type_name, set()).add(str(element_id))
+
+    def forget(self, export_type_name: str, element_id: str) -> None:
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.current["objects"].get(export_type_name, {}).pop(str(element_id), None)
+
+    def save(self) -> None:
+        if not self.enabled:
+            return
+
+        logger = get_logger()
+        self.current["last_full_run"] = time.time() if self.full_run else self.last_full_run
+        self.current["unsplittable"] = {
+            export_type_name: sorted(element_ids) for export_type_name, element_ids in self.unsplittable.items() if element_ids
+        }
+
+        state_file = Path(config.general.incremental.state_file)
+        state_file_tmp = state_file.with_name(f"{state_file.name}.tmp")
+        with Path.open(state_file_tmp, "w") as file:
+            json.dump(self.current, file)
+        state_file_tmp.replace(state_file)
+        logger.debug(f"Incremental backup: state written to {state_file}")
+
+
+backup_state = BackupState()
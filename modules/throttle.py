@@ -0,0 +1,135 @@
+import contextlib
+import math
+import threading
+import time
+from collections.abc import Iterator
+
+import zabbix_utils
+
+from modules.config import config
+from modules.logger import get_logger
+from modules.metrics import metrics
+
+_THROTTLE_EWMA_WEIGHT: float = 0.2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens: float = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+            self.updated = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveLimiter:
+    def __init__(self, min_limit: int, max_limit: int) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = min_limit
+        self.active: int = 0
+        self.epoch: int = 0
+        self.successes: int = 0
+        self.saturated: bool = False
+        self.latency: float | None = None
+        self.condition = threading.Condition()
+
+    def acquire(self) -> int:
+        with self.condition:
+            if self.active >= self.limit:
+                self.saturated = True
+                self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+            return self.epoch
+
+    def release(self, epoch: int, latency: float | None, *, overloaded: bool = False) -> None:
+        with self.condition:
+            self.active -= 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency + _THROTTLE_EWMA_WEIGHT * (latency - self.latency)
+
+            if overloaded or (self.latency is not None and self.latency > config.general.throttle.target_latency):
+                if epoch == self.epoch:
+                    self.set_limit(max(self.min_limit, math.floor(self.limit * config.general.throttle.decrease_factor)))
+            elif latency is not None:
+                self.successes += 1
+                if self.successes >= self.limit and self.saturated:
+                    self.set_limit(min(self.max_limit, self.limit + 1))
+            self.condition.notify_all()
+
+    def set_limit(self, limit: int) -> None:
+        logger = get_logger()
+
+        if limit != self.limit:
+            latency = "-" if self.latency is None else f"{self.latency:.2f}s"
+            message = f"ZBX API: Concurrency limit {self.limit} -> {limit} (latency {latency}, {self.active} in flight)"
+            if limit < self.limit:
+                logger.info(message)
+                metrics.count("throttle_decreases")
+            else:
+                logger.debug(message)
+                metrics.count("throttle_increases")
+            self.limit = limit
+        metrics.gauge("concurrency_limit", self.limit)
+        self.epoch += 1
+        self.successes = 0
+        self.saturated = False
+
+
+class ApiThrottle:
+    def __init__(self) -> None:
+        self.limiter: AdaptiveLimiter | None = None
+        self.bucket: TokenBucket | None = None
+        self.lock = threading.Lock()
+
+    def setup(self, max_threads: int) -> None:
+        logger = get_logger()
+        throttle_config = config.general.throttle
+
+        with self.lock:
+            if throttle_config.adaptive:
+                if self.limiter is None:
+                    self.limiter = AdaptiveLimiter(throttle_config.min_threads, max_threads)
+                    logger.info(f"ZBX API: Adaptive concurrency between {self.limiter.min_limit} and {self.limiter.max_limit} requests")
+                metrics.gauge("concurrency_limit", self.limiter.limit)
+            if throttle_config.max_rps and self.bucket is None:
+                self.bucket = TokenBucket(throttle_config.max_rps, throttle_config.burst or math.ceil(throttle_config.max_rps))
+                logger.info(f"ZBX API: Rate limited to {throttle_config.max_rps} requests per second")
+
+    @contextlib.contextmanager
+    def slot(self, export_type: str | None = None) -> Iterator[None]:
+        if self.limiter is None and self.bucket is None:
+            yield
+            return
+
+        queued = time.perf_counter()
+        if self.bucket is not None:
+            self.bucket.acquire()
+        epoch = self.limiter.acquire() if self.limiter is not None else 0
+        start = time.perf_counter()
+        metrics.observe("throttle_wait", start - queued, export_type)
+
+        latency = None
+        overloaded = False
+        try:
+            yield
+            latency = time.perf_counter() - start
+        except zabbix_utils.exceptions.ProcessingError:
+            overloaded = True
+            raise
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(epoch, latency, overloaded=overloaded)
+
+
+api_throttle = ApiThrottle()
@@ -0,0 +1,35 @@
+import threading
+
+import zabbix_utils
+
+from modules.config import config
+from modules.logger import get_logger
+
+
+class ZabbixAPIPool:
+    def __init__(self) -> None:
+        self.zapi: zabbix_utils.ZabbixAPI | None = None
+        self.lock = threading.Lock()
+
+    def get(self) -> zabbix_utils.ZabbixAPI:
+        if self.zapi is None:
+            with self.lock:
+                if self.zapi is None:
+                    logger = get_logger()
+                    logger.debug(f"ZBX API: Opening session to {config.zabbix.url}")
+                    self.zapi = zabbix_utils.ZabbixAPI(url=config.zabbix.url, **config.zabbix.auth.model_dump())
+        return self.zapi
+
+    def close(self) -> None:
+        with self.lock:
+            if self.zapi is not None:
+                logger = get_logger()
+                logger.debug("ZBX API: Closing session")
+                try:
+                    self.zapi.logout()
+                except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+                    logger.warning(f"ZBX API: Logout failed: {e}")
+                self.zapi = None
+
+
+zapi_pool = ZabbixAPIPool()
@@ -1,18 +1,28 @@
 #!/bin/env python3
+import itertools
 import sys
 
 import zabbix_utils
 from pydantic import ValidationError
 
-import modules.inputs.zapi_configuration_export
+import modules.outputs.archive
 import modules.outputs.git
 import modules.outputs.s3
+import modules.outputs.store
 from modules.config import config
+from modules.inputs import get_input_engine
+from modules.journal import run_journal
 from modules.logger import get_logger
-from modules.models import ExportObjectList
+from modules.metrics import metrics, metrics_report
+from modules.pipeline import run_pipeline
+from modules.state import backup_state
+from modules.zapi import zapi_pool
+
+_EXIT_PARTIAL: int = 2
 
 
 def main() -> None:
+    config.add_argument("--resume", action="store_true", help="Continue the last interrupted or partial run from the journal")
     try:
         config.load_data()
     except FileNotFoundError:
@@ -30,8 +40,9 @@ def main() -> None:
         sys.exit(1)
 
     logger = get_logger()
+    metrics.reset()
     try:
-        zapi = zabbix_utils.ZabbixAPI(url=config.zabbix.url, **config.zabbix.auth.model_dump())
+        zapi = zapi_pool.get()
         logger.debug(f"Connected to Zabbix instance with version {zapi.api_version()}")
     except zabbix_utils.exceptions.APIRequestError as e:
         logger.error(f"ZBX API: {e}")
@@ -40,12 +51,38 @@ def main() -> None:
         logger.error(f"ZBX API: {e}")
         sys.exit(1)
 
+    success = False
+    try:
+        run_backup(zapi)
+        success = True
+    finally:
+        zapi_pool.close()
+        run_journal.interrupt()
+        metrics_report(success=success)
+
+
+def run_backup(zapi: zabbix_utils.ZabbixAPI) -> None:
+    logger = get_logger()
+
     if zapi.version < 5.4:
-        config.zabbix.export_format = "xml"
+        config.override("zabbix", export_format="xml")
         logger.warning(f"Zabbix version < 5.4 detected. Forcing zabbix.export_format to {config.zabbix.export_format}")
 
+    backup_state.load()
+    run_journal.start(resume=config.args.resume)
+
     try:
-        export_data: ExportObjectList = modules.inputs.zapi_configuration_export.zconfig_export()
+        output_errors = run_pipeline(
+            itertools.chain(run_journal.replay(), run_journal.record(get_input_engine().zconfig_export())),
+            run_journal.outputs(
+                {
+                    "Git": modules.outputs.git.export_git,
+                    "S3": modules.outputs.s3.export_s3,
+                    "Archive": modules.outputs.archive.export_archive,
+                    "Store": modules.outputs.store.export_store,
+                },
+            ),
+        )
     except zabbix_utils.exceptions.APIRequestError as e:
         logger.error(f"ZBX API: {e}")
         sys.exit(1)
@@ -53,15 +90,21 @@ def main() -> None:
         logger.error(f"ZBX API: {e}")
         sys.exit(1)
 
-    try:
-        modules.outputs.git.export_git(export_data)
-    except AttributeError:
-        raise
-    except Exception as e:
-        logger.error(f"Output - Git: {e}")
+    for output_name, e in output_errors.items():
+        if isinstance(e, AttributeError):
+            raise e
+        logger.error(f"Output - {output_name}: {e}")
+
+    if output_errors:
         sys.exit(1)
 
-    modules.outputs.s3.export_s3(export_data)
+    if not config.general.dryrun:
+        backup_state.save()
+
+    run_journal.finish()
+    if run_journal.failures:
+        logger.error(f"Backup finished partially, {len(run_journal.failures)} objects could not be exported")
+        sys.exit(_EXIT_PARTIAL)
 
 
 if __name__ == "__main__":
@@ -5,7 +5,7 @@ from pathlib import Path
 from pydantic import ValidationError
 
 from modules.config import config
-from modules.crypto import decrypt
+from modules.crypto import decrypt_stream
 
 
 def main() -> None:
@@ -25,8 +25,8 @@ def main() -> None:
 
     try:
         with Path.open(config.args.file, "rb") as f:
-            data = f.read()
-        print(decrypt(data, config.general.encryption_key))
+            decrypt_stream(f, sys.stdout.buffer, config.general.encryption_key)
+        sys.stdout.buffer.flush()
     except Exception as e:
         print(f"Error on processing input file: {e}")
         sys.exit(1)
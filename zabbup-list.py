@@ -0,0 +1,104 @@
+#!/bin/env python3
+import contextlib
+import datetime as dt
+import json
+import sqlite3
+import sys
+
+from pydantic import ValidationError
+
+from modules.catalog import Catalog
+from modules.config import config
+from modules.logger import get_logger
+from modules.outputs.git import git_catalog_rebuild
+from modules.outputs.s3 import s3_catalog_rebuild
+
+
+def main() -> None:
+    config.add_argument("-n", "--name", help="Object name pattern (* and ? wildcards, case insensitive)")
+    config.add_argument("-t", "--type", help="Object type (e.g. hosts, templates)")
+    config.add_argument("-i", "--id", help="Object id")
+    config.add_argument("-o", "--output", choices=["git", "s3"], help="Only list entries of one output")
+    config.add_argument("--since", type=parse_time, help="Only list entries written at or after this ISO 8601 time")
+    config.add_argument("--until", type=parse_time, help="Only list entries written before this ISO 8601 time")
+    config.add_argument("--runs", action="store_true", help="List backup runs instead of objects")
+    config.add_argument("--json", action="store_true", help="Print entries as JSON lines")
+    config.add_argument("--rebuild", action="store_true", help="Rebuild the catalog from the enabled git and S3 outputs")
+    try:
+        config.load_data()
+    except FileNotFoundError:
+        print(f"Configuration file not found: {config.config_file}")
+        sys.exit(1)
+    except ValidationError as e:
+        print(f"{e.error_count()} found in configuration file:")
+
+        for error in e.errors():
+            print(".".join(error["loc"]))
+            print(f"    {error['msg']}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error on processing configuration file: {e}")
+        sys.exit(1)
+
+    logger = get_logger()
+    try:
+        with contextlib.closing(Catalog()) as catalog:
+            if config.args.rebuild:
+                if not rebuild_catalog(catalog):
+                    sys.exit(1)
+                return
+
+            filters = {"output": config.args.output, "since": config.args.since, "until": config.args.until}
+            if config.args.runs:
+                entries = catalog.runs(**filters)
+            else:
+                entries = catalog.objects(name=config.args.name, type=config.args.type, object_id=config.args.id, **filters)
+    except sqlite3.Error as e:
+        logger.error(f"Catalog: {e}")
+        sys.exit(1)
+
+    for entry in entries:
+        print_entry(dict(entry))
+
+
+def parse_time(value: str) -> float:
+    timestamp = dt.datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dt.UTC)
+    return timestamp.timestamp()
+
+
+def print_entry(entry: dict) -> None:
+    entry["created"] = dt.datetime.fromtimestamp(entry["created"], tz=dt.UTC).isoformat(timespec="seconds")
+    if config.args.json:
+        print(json.dumps(entry))
+    elif config.args.runs:
+        print(f"{entry['created']}  {entry['run_id']}  {entry['output']:<4}  {entry['objects']:>6} objects  {entry['location']}")
+    else:
+        content = "deleted" if entry["deleted"] else (entry["hash"] or "")[-12:]
+        print(
+            f"{entry['created']}  {entry['output']:<4}  {entry['type']:<14}  {entry['object_id']:>8}  {content:<12}  "
+            f"{entry['location']}@{(entry['version'] or '-')[:12]}  {entry['name']}"
+        )
+
+
+def rebuild_catalog(catalog: Catalog) -> bool:
+    logger = get_logger()
+
+    rebuilders = {"git": git_catalog_rebuild, "S3": s3_catalog_rebuild}
+    enabled = {"git": config.outputs.git.enable, "S3": config.outputs.s3.enable}
+    success = True
+    for output_name, rebuilder in rebuilders.items():
+        if not enabled[output_name]:
+            continue
+        logger.info(f"Catalog: Rebuilding from {output_name}")
+        try:
+            logger.info(f"Catalog: {rebuilder(catalog)} {output_name} runs recorded")
+        except Exception as e:
+            logger.error(f"Catalog: Rebuilding from {output_name} failed: {e}")
+            success = False
+    return success
+
+
+if __name__ == "__main__":
+    main()
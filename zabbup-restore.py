@@ -0,0 +1,116 @@
+#!/bin/env python3
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import zabbix_utils
+from pydantic import ValidationError
+
+from modules.config import config
+from modules.exceptions import RestorePathError
+from modules.logger import get_logger
+from modules.restore import (
+    RESTORE_TYPE_ORDER,
+    RestoreSource,
+    restore_files,
+    restore_import,
+    restore_select,
+    restore_source,
+    restore_write,
+)
+from modules.zapi import zapi_pool
+
+
+def main() -> None:
+    config.add_argument("-s", "--source", help="Directory or s3://<bucket>/<prefix> with exported files")
+    config.add_argument("--snapshot", help="Restore a snapshot of the content addressed store (name or 'latest')")
+    config.add_argument("-t", "--target", help="Directory to write the decrypted files to")
+    config.add_argument("--import", dest="zabbix_import", action="store_true", help="Import the files via configuration.import")
+    config.add_argument("--types", help=f"Comma separated list of types to restore ({','.join(RESTORE_TYPE_ORDER)})")
+    config.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of decryption processes")
+    try:
+        config.load_data()
+    except FileNotFoundError:
+        print(f"Configuration file not found: {config.config_file}")
+        sys.exit(1)
+    except ValidationError as e:
+        print(f"{e.error_count()} found in configuration file:")
+
+        for error in e.errors():
+            print(".".join(error["loc"]))
+            print(f"    {error['msg']}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error on processing configuration file: {e}")
+        sys.exit(1)
+
+    if (config.args.source is None) == (config.args.snapshot is None):
+        print("Either --source or --snapshot is required")
+        sys.exit(1)
+    if config.args.target is None and not config.args.zabbix_import:
+        print("Nothing to do, use --target and/or --import")
+        sys.exit(1)
+
+    if not run_restore():
+        sys.exit(1)
+
+
+def run_restore() -> bool:
+    logger = get_logger()
+    types = set(config.args.types.split(",")) if config.args.types else None
+    try:
+        source = restore_source(config.args.source, config.args.snapshot)
+        selected = restore_select(source.paths(), types)
+    except Exception as e:
+        logger.error(f"Restore: {e}")
+        return False
+    logger.info(f"Restore: {len(selected)} files selected")
+
+    documents, errors = read_files(source, selected)
+    if config.args.target is not None:
+        logger.info(f"Restore: {len(selected) - len(errors)} files written to {config.args.target}")
+
+    if config.args.zabbix_import:
+        if config.general.dryrun:
+            logger.info("Dryrun enabled, skipping import")
+        else:
+            try:
+                import_errors = restore_import(documents)
+            except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+                logger.error(f"ZBX API: {e}")
+                return False
+            finally:
+                zapi_pool.close()
+            imported = sum(len(entries) for entries in documents.values()) - len(import_errors)
+            logger.info(f"Restore: {imported} files imported, {len(import_errors)} failed")
+            errors.update(import_errors)
+
+    return not errors
+
+
+def read_files(source: RestoreSource, selected: list[tuple[str, str]]) -> tuple[dict[str, list], dict[str, Exception]]:
+    logger = get_logger()
+
+    errors: dict[str, Exception] = {}
+    documents: dict[str, list] = {}
+    with ProcessPoolExecutor(max_workers=config.args.workers) as decrypt_executor:
+        for path, restore_type, content in restore_files(source, selected, decrypt_executor):
+            if isinstance(content, Exception):
+                logger.error(f"Restore: Reading {path} failed: {content!r}")
+                errors[path] = content
+                continue
+            if config.args.target is not None:
+                try:
+                    restore_write(Path(config.args.target), path, content)
+                except RestorePathError as e:
+                    logger.error(f"Restore: {e}")
+                    errors[path] = e
+                    continue
+            if config.args.zabbix_import:
+                documents.setdefault(restore_type, []).append((path, content))
+    return documents, errors
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/bin/env python3
+import functools
+import itertools
+import sys
+import time
+
+import zabbix_utils
+from pydantic import ValidationError
+
+import modules.outputs.git
+import modules.outputs.s3
+import modules.outputs.store
+from modules.config import config
+from modules.inputs import get_input_engine
+from modules.inputs.zapi_auditlog import AuditLogWatcher
+from modules.journal import run_journal
+from modules.logger import get_logger
+from modules.metrics import metrics, metrics_report
+from modules.pipeline import run_pipeline
+from modules.zapi import zapi_pool
+
+
+def main() -> None:
+    config.add_argument("--once", action="store_true", help="Process pending audit log entries once and exit")
+    try:
+        config.load_data()
+    except FileNotFoundError:
+        print(f"Configuration file not found: {config.config_file}")
+        sys.exit(1)
+    except ValidationError as e:
+        print(f"{e.error_count()} found in configuration file:")
+
+        for error in e.errors():
+            print(".".join(error["loc"]))
+            print(f"    {error['msg']}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error on processing configuration file: {e}")
+        sys.exit(1)
+
+    logger = get_logger()
+    try:
+        zapi = zapi_pool.get()
+        logger.debug(f"Connected to Zabbix instance with version {zapi.api_version()}")
+    except zabbix_utils.exceptions.APIRequestError as e:
+        logger.error(f"ZBX API: {e}")
+        sys.exit(1)
+    except zabbix_utils.exceptions.ProcessingError as e:
+        logger.error(f"ZBX API: {e}")
+        sys.exit(1)
+
+    if zapi.version < 5.4:
+        config.override("zabbix", export_format="xml")
+        logger.warning(f"Zabbix version < 5.4 detected. Forcing zabbix.export_format to {config.zabbix.export_format}")
+
+    watcher = AuditLogWatcher()
+    watcher.load()
+
+    try:
+        while True:
+            try:
+                run_watch_cycle(watcher)
+            except (zabbix_utils.exceptions.APIRequestError, zabbix_utils.exceptions.ProcessingError) as e:
+                logger.error(f"ZBX API: {e}")
+
+            if config.args.once:
+                break
+            time.sleep(config.general.watch.interval)
+    except KeyboardInterrupt:
+        logger.info("Stopping audit log watch")
+    finally:
+        zapi_pool.close()
+
+
+def run_watch_cycle(watcher: AuditLogWatcher) -> None:
+    logger = get_logger()
+
+    watermark = (watcher.clock, set(watcher.auditids))
+    entries = watcher.poll()
+    if not entries:
+        return
+
+    logger.debug(f"Audit log: {len(entries)} new entries, waiting {config.general.watch.window}s for related changes")
+    try:
+        exported = run_watch_export(watcher, entries)
+    except BaseException:
+        watcher.clock, watcher.auditids = watermark
+        raise
+
+    if exported:
+        watcher.save()
+    else:
+        watcher.clock, watcher.auditids = watermark
+
+
+def run_watch_export(watcher: AuditLogWatcher, entries: list[dict]) -> bool:
+    logger = get_logger()
+
+    time.sleep(config.general.watch.window)
+    entries += watcher.poll()
+
+    selection, deleted = watcher.changes(entries)
+    if not selection and not deleted:
+        return True
+
+    changed = ", ".join(f"{len(element_ids)} {export_type_name}" for export_type_name, element_ids in selection.items())
+    logger.info(f"Audit log: re-exporting {changed or 'nothing'} and removing {len(deleted)} objects")
+
+    metrics.reset()
+    run_journal.reset()
+
+    output_errors = run_pipeline(
+        itertools.chain(get_input_engine().zconfig_export(selection), deleted),
+        {
+            "Git": functools.partial(modules.outputs.git.export_git, complete=False),
+            "S3": functools.partial(modules.outputs.s3.export_s3, complete=False),
+            "Store": functools.partial(modules.outputs.store.export_store, complete=False),
+        },
+    )
+    for output_name, e in output_errors.items():
+        logger.error(f"Output - {output_name}: {e}")
+    if run_journal.failures:
+        logger.warning(f"Audit log: {len(run_journal.failures)} objects failed to export, keeping the watermark to retry them")
+    metrics_report(success=not output_errors and not run_journal.failures)
+
+    return not output_errors and not run_journal.failures
+
+
+if __name__ == "__main__":
+    main()